@@ -0,0 +1,60 @@
+# docker-compose exec app python3 aggregate.py -e tictactoe -m
+
+import os
+import argparse
+
+from utils.results import read_results, merge_shards, aggregate, write_csv, write_matrix
+
+import config
+
+
+def main(args):
+
+  if args.merge:
+    n_shards = merge_shards(args.results_dir)
+    print(f'Merged {n_shards} shards in {args.results_dir}')
+
+  columns = read_results(args.results_dir, args.env_name)
+  if len(columns['p1']) == 0:
+    print(f'No results found for {args.env_name} in {args.results_dir}')
+    return
+
+  results = aggregate(columns)
+  names = sorted(set(p for pairing in results for p in pairing))
+
+  os.makedirs(config.VIZDIR, exist_ok = True)
+  prefix = os.path.join(config.VIZDIR, f'results_{args.env_name}')
+  fieldnames = ['p1', 'p2', 'games', 'p1_points', 'p2_points', 'p1_wins', 'p2_wins', 'draws', 'episode_length']
+  write_csv(f'{prefix}.csv', [results[pairing] for pairing in sorted(results)], fieldnames)
+  write_matrix(f'{prefix}_score.csv', names, results, lambda r: r['p1_points'] / r['games'])
+  write_matrix(f'{prefix}_winrate.csv', names, results, lambda r: r['p1_wins'] / r['games'])
+  print(f"Aggregated {len(columns['p1'])} games across {len(results)} pairings")
+  print(f'Results written to {prefix}.csv, {prefix}_score.csv and {prefix}_winrate.csv')
+
+
+def cli() -> None:
+  """Handles argument extraction from CLI and passing to main().
+  Note that a separate function is used rather than in __name__ == '__main__'
+  to allow unit testing of cli().
+  """
+  # Setup argparse to show defaults on help
+  formatter_class = argparse.ArgumentDefaultsHelpFormatter
+  parser = argparse.ArgumentParser(formatter_class=formatter_class)
+
+  parser.add_argument("--env_name", "-e",  type = str, default = 'tictactoe'
+            , help="Which game's results to aggregate?")
+  parser.add_argument("--results_dir", "-rd",  type = str, default = config.RESULTSDIR
+            , help="The directory of result shards written by test.py -w")
+  parser.add_argument("--merge", "-m",  action = 'store_true', default = False
+            , help="Compact all the shards into one before aggregating")
+
+  # Extract args
+  args = parser.parse_args()
+
+  # Enter main
+  main(args)
+  return
+
+
+if __name__ == '__main__':
+  cli()
@@ -0,0 +1,452 @@
+# docker-compose exec app python3 benchmark.py -b envs -n 20000 -o viz/benchmark_envs.json
+# docker-compose exec app python3 benchmark.py -b training -e tictactoe connect4 -np 2 -bl viz/benchmark_training.json
+
+import os
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+os.environ['CUDA_VISIBLE_DEVICES'] = '' # the policy benchmark is for CPU inference
+
+import tensorflow as tf
+tf.get_logger().setLevel('INFO')
+tf.compat.v1.logging.set_verbosity(tf.compat.v1.logging.ERROR)
+
+import sys
+import json
+import time
+import shlex
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import numpy as np
+
+from stable_baselines import logger
+from stable_baselines.ppo1 import PPO1
+
+from utils.register import get_environment, get_network_arch
+from utils.numpy_policy import NumpyModel
+from utils.selfplay import selfplay_wrapper
+from utils.workers import SelfPlayGames
+
+import config
+
+ENVS = ['tictactoe', 'connect4', 'sushigo', 'butterfly', 'geschenkt', 'frouge']
+OPERATIONS = ['reset', 'step', 'observation', 'legal_actions']
+POLICY_METHODS = ['proba_step', 'value', 'step']
+
+
+def random_legal_action(env):
+  return np.random.choice(np.flatnonzero(env.legal_actions))
+
+
+def steps_per_second(env, n_steps):
+  # random legal moves, rendering before every move as SelfPlayEnv does
+  env.reset()
+  start = time.perf_counter()
+  for _ in range(n_steps):
+    env.render()
+    _, _, done, _ = env.step(random_legal_action(env))
+    if done:
+      env.render()
+      env.reset()
+  return n_steps / (time.perf_counter() - start)
+
+
+def render_benchmark(env_name, n_steps, seed):
+  """
+  Steps per second of an env with the render / debug fast path (INFO level),
+  against the same games with every render and debug line formatted (DEBUG level, output discarded).
+  """
+  env = get_environment(env_name)(verbose = True)
+  result = {'env': env_name}
+  for key, level in [('debug', config.DEBUG), ('fast', config.INFO)]:
+    logger.set_level(level)
+    random.seed(seed)
+    np.random.seed(seed)
+    result[key] = steps_per_second(env, n_steps)
+  env.close()
+  result['speedup'] = result['fast'] / result['debug']
+  return result
+
+
+def env_benchmark(env_name, n_steps, seed):
+  """
+  Seeded random-legal-move games, timing reset, step, observation and legal_actions separately.
+  step includes building the observation it returns, as it does in training.
+  """
+  logger.set_level(config.INFO)
+  random.seed(seed)
+  np.random.seed(seed)
+  env = get_environment(env_name)(verbose = False)
+  clock = time.perf_counter
+  totals = dict.fromkeys(OPERATIONS, 0.0)
+  calls = dict.fromkeys(OPERATIONS, 0)
+  games = 0
+
+  start = clock()
+  t = clock()
+  env.reset()
+  totals['reset'] += clock() - t
+  calls['reset'] += 1
+
+  for _ in range(n_steps):
+    t0 = clock()
+    env.observation
+    t1 = clock()
+    legal_actions = env.legal_actions
+    t2 = clock()
+    action = np.random.choice(np.flatnonzero(legal_actions))
+    t3 = clock()
+    _, _, done, _ = env.step(action)
+    t4 = clock()
+    totals['observation'] += t1 - t0
+    totals['legal_actions'] += t2 - t1
+    totals['step'] += t4 - t3
+
+    if done:
+      games += 1
+      t = clock()
+      env.reset()
+      totals['reset'] += clock() - t
+      calls['reset'] += 1
+
+  elapsed = clock() - start
+  env.close()
+
+  calls['step'] = calls['observation'] = calls['legal_actions'] = n_steps
+  result = {'env': env_name, 'steps': n_steps, 'games': games, 'seconds': elapsed, 'steps_per_second': n_steps / elapsed}
+  for operation in OPERATIONS:
+    result[operation] = {'calls': calls[operation], 'mean_us': 1e6 * totals[operation] / calls[operation], 'per_second': calls[operation] / totals[operation]}
+  return result
+
+
+def sample_observations(env, n):
+  # observations from random legal games, so that every part of the observation is realistic
+  observations = []
+  env.reset()
+  while len(observations) < n:
+    observations.append(np.array(env.observation))
+    _, _, done, _ = env.step(random_legal_action(env))
+    if done:
+      env.reset()
+  return np.stack(observations)
+
+
+def call_latencies(fn, observations, min_time):
+  for _ in range(3): # warm up
+    fn(observations)
+  latencies = []
+  start = time.perf_counter()
+  while len(latencies) < 5 or time.perf_counter() - start < min_time:
+    t = time.perf_counter()
+    fn(observations)
+    latencies.append(time.perf_counter() - t)
+  return np.array(latencies)
+
+
+def policy_benchmark(env_name, batch_sizes, min_time, seed):
+  """
+  Latency and throughput of proba_step, value and step of the env's CustomPolicy on CPU,
+  for single observations and batches, through the TF policy and its NumPy forward pass.
+  """
+  logger.set_level(config.INFO)
+  random.seed(seed)
+  np.random.seed(seed)
+  env = get_environment(env_name)(verbose = False)
+  observations = sample_observations(env, max(batch_sizes))
+
+  model = PPO1(get_network_arch(env_name), env = env, seed = seed)
+  params = model.get_parameters()
+  policies = {'tf': model.policy_pi, 'numpy': NumpyModel.from_ppo(model, env).policy_pi}
+
+  rows = []
+  for backend, policy in policies.items():
+    for method in POLICY_METHODS:
+      fn = getattr(policy, method)
+      for batch_size in batch_sizes:
+        latencies = call_latencies(fn, observations[:batch_size], min_time)
+        rows.append({
+          'backend': backend,
+          'method': method,
+          'batch_size': batch_size,
+          'calls': len(latencies),
+          'mean_us': 1e6 * latencies.mean(),
+          'p50_us': 1e6 * np.percentile(latencies, 50),
+          'p95_us': 1e6 * np.percentile(latencies, 95),
+          'observations_per_second': batch_size / latencies.mean()
+        })
+
+  env.close()
+  # the saved parameters are exactly the policy's weights
+  n_parameters = int(sum(value.size for value in params.values()))
+  if n_parameters == 0:
+    raise Exception(f'No policy parameters found for {env_name}')
+  return {
+    'env': env_name,
+    'observation_shape': list(observations.shape[1:]),
+    'parameters': n_parameters,
+    'rows': rows
+  }
+
+
+def copy_base_model(env_name, model_dir):
+  # runs start from the zoo's base.zip where there is one, so they are comparable - otherwise a new one is created in model_dir
+  os.makedirs(model_dir, exist_ok = True)
+  base = os.path.join(config.MODELDIR, env_name, 'base.zip')
+  if os.path.exists(base):
+    shutil.copyfile(base, os.path.join(model_dir, 'base.zip'))
+
+
+def training_benchmark(env_name, iterations, ranks, seed, train_args):
+  """
+  A short seeded run of train.py - iterations PPO updates over ranks MPI ranks - in a scratch directory, so the zoo
+  and logs are left alone. The zoo's base.zip is copied in where there is one, so every run starts from the same weights.
+  Timesteps/s cover learn() only, not TF start-up or train.py's waits for the base model.
+  """
+  parser = argparse.ArgumentParser(allow_abbrev = False)
+  parser.add_argument("--timesteps_per_actorbatch", "-tpa", type = int, default = 1024)
+  timesteps_per_actorbatch = parser.parse_known_args(train_args)[0].timesteps_per_actorbatch
+
+  directory = tempfile.mkdtemp(prefix = f'benchmark_{env_name}_')
+  try:
+    copy_base_model(env_name, os.path.join(directory, config.MODELDIR, env_name))
+
+    stats_file = os.path.join(directory, 'stats.json')
+    command = (['mpirun', '-np', str(ranks)] if ranks > 1 else []) + [
+      sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'train.py'),
+      '-e', env_name, '-s', str(seed), '-tm',
+      '-tt', str(iterations * timesteps_per_actorbatch * ranks),
+      '-sf', stats_file] + train_args
+
+    start = time.perf_counter()
+    subprocess.run(command, cwd = directory, check = True, stdout = subprocess.DEVNULL)
+    wall_seconds = time.perf_counter() - start
+
+    with open(stats_file) as f:
+      stats = json.load(f)
+  finally:
+    shutil.rmtree(directory, ignore_errors = True)
+
+  return dict({'env': env_name, 'iterations': iterations, 'wall_seconds': wall_seconds}, **stats)
+
+
+def regressions(results, baseline, metrics, tolerance):
+  """
+  Compares results with a baseline run of the same benchmark, env by env. metrics maps each compared
+  key to 'higher' or 'lower', whichever is better; a regression is a change the wrong way of more than tolerance.
+  """
+  baseline = {result['env']: result for result in baseline['results']}
+  failed = []
+  for result in results:
+    before = baseline.get(result['env'])
+    if before is None:
+      logger.warn(f"No baseline for {result['env']}")
+      continue
+    for key, better in metrics.items():
+      if result.get(key) is None or not before.get(key):
+        continue
+      change = result[key] / before[key] - 1
+      regressed = change < -tolerance if better == 'higher' else change > tolerance
+      print(f"{result['env']:<12}{key:<24}{before[key]:>12.2f}{result[key]:>12.2f}{100 * change:>+9.1f}%{'  REGRESSION' if regressed else ''}")
+      if regressed:
+        failed.append((result['env'], key))
+  return failed
+
+
+class CallCounter():
+  # wraps a model's method to count its calls and the observations passed through them
+  def __init__(self, fn):
+    self.fn = fn
+    self.calls = 0
+    self.observations = 0
+
+  def __call__(self, observations):
+    self.calls += 1
+    self.observations += len(observations)
+    return self.fn(observations)
+
+
+def opponents_benchmark(env_name, n_games, n_steps, numpy_opponents, seed):
+  """
+  Learner steps per second of SelfPlayGames against the base model, for each number of concurrent games,
+  with random legal learner moves. The opponent moves of each round share one forward pass per model,
+  so several games must average more than one opponent move per pass.
+  The games load their opponents from a scratch zoo, so the real one is left alone.
+  """
+  logger.set_level(config.INFO)
+  random.seed(seed)
+  np.random.seed(seed)
+  base_env = get_environment(env_name)
+
+  directory = tempfile.mkdtemp(prefix = f'benchmark_{env_name}_')
+  copy_base_model(env_name, os.path.join(directory, env_name))
+  model_dir, config.MODELDIR = config.MODELDIR, directory
+  try:
+    rows = [opponents_row(base_env, n, n_steps, numpy_opponents) for n in n_games]
+  finally:
+    config.MODELDIR = model_dir
+    shutil.rmtree(directory, ignore_errors = True)
+
+  return {'env': env_name, 'numpy_opponents': numpy_opponents, 'rows': rows}
+
+
+def opponents_row(base_env, n, n_steps, numpy_opponents):
+  games = SelfPlayGames([selfplay_wrapper(base_env)(opponent_type = 'base', verbose = False, numpy_opponents = numpy_opponents) for _ in range(n)])
+  model = games.envs[0].opponent_model('base.zip')
+  model.action_probability = counter = CallCounter(model.action_probability)
+  games.reset()
+  steps = max(1, n_steps // n)
+  start = time.perf_counter()
+  for _ in range(steps):
+    games.step([random_legal_action(env) for env in games.envs])
+  elapsed = time.perf_counter() - start
+  del model.action_probability
+  games.close()
+
+  if n > 1 and counter.observations == counter.calls:
+    raise Exception(f'The opponent moves of {n} {games.envs[0].name} games were never batched')
+  return {
+    'n_games': n,
+    'steps_per_second': n * steps / elapsed,
+    'opponent_moves': counter.observations,
+    'forward_passes': counter.calls,
+    'mean_batch': counter.observations / max(1, counter.calls)
+  }
+
+
+def git_commit():
+  try:
+    return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr = subprocess.DEVNULL).decode().strip()
+  except Exception:
+    return None
+
+
+def report_render(results):
+  print(f"{'env':<12}{'debug steps/s':>16}{'fast steps/s':>16}{'speedup':>10}")
+  for result in results:
+    print(f"{result['env']:<12}{result['debug']:>16.0f}{result['fast']:>16.0f}{result['speedup']:>9.1f}x")
+
+
+def report_envs(results):
+  print(f"{'env':<12}{'steps/s':>10}" + ''.join(f'{operation + " us":>18}' for operation in OPERATIONS))
+  for result in results:
+    print(f"{result['env']:<12}{result['steps_per_second']:>10.0f}" + ''.join(f"{result[operation]['mean_us']:>18.1f}" for operation in OPERATIONS))
+
+
+def report_policy(results):
+  print(f"{'env':<12}{'backend':<8}{'method':<12}{'batch':>6}{'mean us':>12}{'p95 us':>12}{'obs/s':>12}")
+  for result in results:
+    for row in result['rows']:
+      print(f"{result['env']:<12}{row['backend']:<8}{row['method']:<12}{row['batch_size']:>6}{row['mean_us']:>12.1f}{row['p95_us']:>12.1f}{row['observations_per_second']:>12.0f}")
+
+
+def report_opponents(results):
+  print(f"{'env':<12}{'games':>6}{'steps/s':>10}{'opponent moves':>16}{'passes':>10}{'mean batch':>12}")
+  for result in results:
+    for row in result['rows']:
+      print(f"{result['env']:<12}{row['n_games']:>6}{row['steps_per_second']:>10.0f}{row['opponent_moves']:>16}{row['forward_passes']:>10}{row['mean_batch']:>12.1f}")
+
+
+def report_training(results):
+  print(f"{'env':<12}{'ranks':>6}{'timesteps':>12}{'timesteps/s':>14}{'eval s':>10}{'peak MB':>10}")
+  for result in results:
+    evaluation = result['evaluation_seconds'] if result['evaluation_seconds'] is not None else float('nan')
+    print(f"{result['env']:<12}{result['ranks']:>6}{result['timesteps']:>12}{result['timesteps_per_second']:>14.0f}{evaluation:>10.1f}{result['peak_rss_mb']:>10.0f}")
+
+
+# each benchmark's runner, report and the metrics a baseline comparison checks
+BENCHMARKS = {
+  'envs': (lambda env_name, args: env_benchmark(env_name, args.n_steps, args.seed), report_envs, {'steps_per_second': 'higher'}),
+  'render': (lambda env_name, args: render_benchmark(env_name, args.n_steps, args.seed), report_render, {'fast': 'higher'}),
+  'policy': (lambda env_name, args: policy_benchmark(env_name, args.batch_sizes, args.min_time, args.seed), report_policy, {}),
+  'opponents': (lambda env_name, args: opponents_benchmark(env_name, args.n_games, args.n_steps, args.numpy_opponents, args.seed), report_opponents, {}),
+  'training': (lambda env_name, args: training_benchmark(env_name, args.iterations, args.ranks, args.seed, shlex.split(args.train_args)), report_training
+    , {'timesteps_per_second': 'higher', 'evaluation_seconds': 'lower', 'peak_rss_mb': 'lower'}),
+}
+
+
+def main(args):
+
+  # no output formats, so DEBUG runs pay for the formatting but nothing is written
+  logger.configure(format_strs = [])
+
+  benchmark, report, metrics = BENCHMARKS[args.benchmark]
+  results = [benchmark(env_name, args) for env_name in args.env_names]
+  report(results)
+
+  if args.output:
+    out = {
+      'benchmark': args.benchmark,
+      'commit': git_commit(),
+      'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+      'python': platform.python_version(),
+      'numpy': np.__version__,
+      'platform': platform.platform(),
+      'args': vars(args),
+      'results': results
+    }
+    with open(args.output, 'w') as f:
+      json.dump(out, f, indent = 2)
+    print(f'Results written to {args.output}')
+
+  if args.baseline:
+    with open(args.baseline) as f:
+      baseline = json.load(f)
+    if baseline['benchmark'] != args.benchmark:
+      raise Exception(f"{args.baseline} is a {baseline['benchmark']} benchmark, not {args.benchmark}")
+    failed = regressions(results, baseline, metrics, args.tolerance)
+    if len(failed) > 0:
+      print(f'{len(failed)} regressions beyond {100 * args.tolerance:.0f}% of {args.baseline}')
+      sys.exit(1)
+    print(f'No regressions beyond {100 * args.tolerance:.0f}% of {args.baseline}')
+
+
+def cli() -> None:
+  """Handles argument extraction from CLI and passing to main().
+  Note that a separate function is used rather than in __name__ == '__main__'
+  to allow unit testing of cli().
+  """
+  # Setup argparse to show defaults on help
+  formatter_class = argparse.ArgumentDefaultsHelpFormatter
+  parser = argparse.ArgumentParser(formatter_class=formatter_class)
+
+  parser.add_argument("--benchmark", "-b", type = str, default = 'envs', choices = list(BENCHMARKS)
+            , help="envs: time reset / step / observation / legal_actions; render: steps/s with and without debug output; policy: inference latency per architecture; opponents: batched opponent moves over concurrent games; training: a short train.py run")
+  parser.add_argument("--env_names", "-e", nargs = '+', type = str, default = ENVS
+            , help="Which games to benchmark?")
+  parser.add_argument("--n_steps", "-n", type = int, default = 10000
+            , help="Number of steps to time in each env")
+  parser.add_argument("--batch_sizes", "-bs", nargs = '+', type = int, default = [1, 8, 32, 128]
+            , help="Batch sizes for the policy benchmark")
+  parser.add_argument("--min_time", "-mt", type = float, default = 0.5
+            , help="Seconds to time each policy method and batch size for")
+  parser.add_argument("--n_games", "-ng", nargs = '+', type = int, default = [1, 8, 32]
+            , help="Numbers of concurrent games for the opponents benchmark")
+  parser.add_argument("--numpy_opponents", "-no", action = 'store_true', default = False
+            , help="Run the opponents benchmark's opponent models as NumPy forward passes instead of TF sessions")
+  parser.add_argument("--iterations", "-it", type = int, default = 10
+            , help="PPO iterations of the training benchmark")
+  parser.add_argument("--ranks", "-np", type = int, default = 1
+            , help="MPI ranks of the training benchmark (more than 1 runs train.py through mpirun)")
+  parser.add_argument("--train_args", "-ta", type = str, default = '-ef 2048 -ne 20'
+            , help="Further train.py arguments for the training benchmark - by default an evaluation every other iteration")
+  parser.add_argument("--output", "-o", type = str, default = None
+            , help="Write the results to this JSON file")
+  parser.add_argument("--baseline", "-bl", type = str, default = None
+            , help="A JSON file written by -o to compare the results with - exits with status 1 on a regression")
+  parser.add_argument("--tolerance", "-tl", type = float, default = 0.1
+            , help="Relative change of a metric beyond which it is a regression")
+  parser.add_argument("--seed", "-s",  type = int, default = 17
+            , help="Random seed")
+
+  # Extract args
+  args = parser.parse_args()
+
+  # Enter main
+  main(args)
+  return
+
+
+if __name__ == '__main__':
+  cli()
@@ -6,6 +6,9 @@ ERROR = 40
 DISABLED = 50
 
 LOGDIR = "logs"
-RESULTSPATH = 'viz/results.csv'
-TMPMODELDIR = "zoo/tmp"
+VIZDIR = 'viz'
+RESULTSDIR = 'viz/results'
+REPLAYDIR = 'viz/replays'
 MODELDIR = "zoo"
+MANIFEST = "manifest.jsonl"
+RATINGS = "ratings.json"
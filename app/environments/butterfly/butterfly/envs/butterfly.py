@@ -11,6 +11,7 @@ from .classes import *
 
 class ButterflyEnv(gym.Env):
     metadata = {'render.modes': ['human']}
+    reward_range = (-1, 1)
 
     def __init__(self, verbose = False, manual = False):
         super(ButterflyEnv, self).__init__()
@@ -223,16 +224,19 @@ class ButterflyEnv(gym.Env):
 
 
     def choose_net_tile(self):
-        logger.debug(f'Player {self.current_player.id} choosing extra tile using net')
+        if logger.get_level() <= config.DEBUG:
+            logger.debug(f'Player {self.current_player.id} choosing extra tile using net')
         self.current_player.position.add(self.drawbag.draw(1))
 
     def choose_tile(self, square):
         tile = self.board.remove(square)
         if tile is None:
-            logger.debug(f"Player {self.current_player.id} trying to pick tile from square {square} but doesn't exist!")
+            if logger.get_level() <= config.DEBUG:
+                logger.debug(f"Player {self.current_player.id} trying to pick tile from square {square} but doesn't exist!")
             raise Exception('tile not found')
 
-        logger.debug(f"Player {self.current_player.id} picking {tile.symbol}")
+        if logger.get_level() <= config.DEBUG:
+            logger.debug(f"Player {self.current_player.id} picking {tile.symbol}")
         self.current_player.position.add([tile])
 
 
@@ -299,7 +303,8 @@ class ButterflyEnv(gym.Env):
 
         self.current_player_num = 0
         self.done = False
-        logger.debug(f'\n\n---- NEW GAME ----')
+        if logger.get_level() <= config.DEBUG:
+            logger.debug('\n\n---- NEW GAME ----')
 
         self.board = Board(self.board_size)
         
@@ -316,6 +321,8 @@ class ButterflyEnv(gym.Env):
 
 
     def render(self, mode='human', close=False):
+        if logger.get_level() > config.DEBUG:
+            return
         
         if close:
             return
@@ -23,6 +23,7 @@ class Token():
         
 class Connect4Env(gym.Env):
     metadata = {'render.modes': ['human']}
+    reward_range = (-1, 1)
 
     def __init__(self, verbose = False, manual = False):
         super(Connect4Env, self).__init__()
@@ -146,11 +147,14 @@ class Connect4Env(gym.Env):
         self.current_player_num = 0
         self.turns_taken = 0
         self.done = False
-        logger.debug(f'\n\n---- NEW GAME ----')
+        if logger.get_level() <= config.DEBUG:
+            logger.debug('\n\n---- NEW GAME ----')
         return self.observation
 
 
     def render(self, mode='human', close=False):
+        if logger.get_level() > config.DEBUG:
+            return
         logger.debug('')
         if close:
             return
@@ -24,6 +24,7 @@ PLAYER_COLOR_MAP = {
 
 class FlammeRougeEnv(gym.Env):
     metadata = {'render.modes': ['human']}
+    reward_range = (-1, 1)
 
     def __init__(self, verbose = False, manual = False):
         super(FlammeRougeEnv, self).__init__()
@@ -383,12 +384,16 @@ class FlammeRougeEnv(gym.Env):
 
         self.done = False
         self.last_turn = False
-        logger.debug(f'\n\n---- NEW GAME ----')
+        if logger.get_level() <= config.DEBUG:
+            logger.debug('\n\n---- NEW GAME ----')
         self.render_map(first_turn=True)
 
         return self.observation
 
     def render_map(self,first_turn=False):
+        if logger.get_level() > config.DEBUG:
+            # the map is 360 formatted cells - skip building it when nothing is logged
+            return
 
         #clear screen
         # logger.debug('\033[2J')
@@ -444,6 +449,8 @@ class FlammeRougeEnv(gym.Env):
 
 
     def render(self, mode='human', close=False):
+        if logger.get_level() > config.DEBUG:
+            return
 
         if close:
             return
@@ -10,6 +10,7 @@ from .classes import *
 
 class GeschenktEnv(gym.Env):
     metadata = {'render.modes': ['human']}
+    reward_range = (-1, 1)
 
     def __init__(self, verbose = False, manual = False, n_players = 3):
         super(GeschenktEnv, self).__init__()
@@ -145,13 +146,15 @@ class GeschenktEnv(gym.Env):
         #play the card(s)
         else:
             if action == 0:
-                logger.debug(f'\nPlayer chooses to play a counter')
+                if logger.get_level() <= config.DEBUG:
+                    logger.debug('\nPlayer chooses to play a counter')
                 self.current_player.counters.remove(1)
                 self.centre_counters.add(1)
                 self.current_player_num = (self.current_player_num + 1) % self.n_players
 
             else:
-                logger.debug(f'Player chooses to take card {self.centre_card.cards[0].symbol} and {self.centre_counters.size()} counters')
+                if logger.get_level() <= config.DEBUG:
+                    logger.debug(f'Player chooses to take card {self.centre_card.cards[0].symbol} and {self.centre_counters.size()} counters')
                 self.current_player.position.add(self.centre_card.cards)
                 self.current_player.counters.add(self.centre_counters.size())
                 self.centre_card.reset()
@@ -204,11 +207,14 @@ class GeschenktEnv(gym.Env):
         self.current_player_num = 0
         self.done = False
 
-        logger.debug(f'\n\n---- NEW GAME ----')
+        if logger.get_level() <= config.DEBUG:
+            logger.debug('\n\n---- NEW GAME ----')
         return self.observation
 
 
     def render(self, mode='human', close=False):
+        if logger.get_level() > config.DEBUG:
+            return
         
         if close:
             return
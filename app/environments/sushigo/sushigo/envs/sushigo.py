@@ -10,6 +10,7 @@ from .classes import *
 
 class SushiGoEnv(gym.Env):
     metadata = {'render.modes': ['human']}
+    reward_range = (-1, 1)
 
     def __init__(self, verbose = False, manual = False):
         super(SushiGoEnv, self).__init__()
@@ -139,38 +140,42 @@ class SushiGoEnv(gym.Env):
 
 
     def score_puddings(self):
-        logger.debug('\nPudding counts...')
-
         puddings = []
         for p in self.players:
             puddings.append(len([card for card in p.position.cards if card.type == 'pudding']))
         
-        logger.debug(f'Puddings: {puddings}')
+        if logger.get_level() <= config.DEBUG:
+            logger.debug('\nPudding counts...')
+            logger.debug(f'Puddings: {puddings}')
 
         pudding_winners = self.get_limits(puddings, 'max')
 
         for i in pudding_winners:
             self.players[i].score += 6 // len(pudding_winners)
-            logger.debug(f'Player {self.players[i].id} 1st place puddings: {6 // len(pudding_winners)}')
+            if logger.get_level() <= config.DEBUG:
+                logger.debug(f'Player {self.players[i].id} 1st place puddings: {6 // len(pudding_winners)}')
         
         pudding_losers = self.get_limits(puddings, 'min')
 
         for i in pudding_losers:
             self.players[i].score -= 6 // len(pudding_losers)
-            logger.debug(f'Player {self.players[i].id} last place puddings: {-6 // len(pudding_losers)}')
+            if logger.get_level() <= config.DEBUG:
+                logger.debug(f'Player {self.players[i].id} last place puddings: {-6 // len(pudding_losers)}')
 
 
 
     def score_maki(self, maki):
-        logger.debug('\nMaki counts...')
-        logger.debug(f'Maki: {maki}')
+        if logger.get_level() <= config.DEBUG:
+            logger.debug('\nMaki counts...')
+            logger.debug(f'Maki: {maki}')
 
         maki_winners = self.get_limits(maki, 'max')
 
         for i in maki_winners:
             self.players[i].score += 6 // len(maki_winners)
             maki[i] = None #mask out the winners
-            logger.debug(f'Player {self.players[i].id} 1st place maki: {6 // len(maki_winners)}')
+            if logger.get_level() <= config.DEBUG:
+                logger.debug(f'Player {self.players[i].id} 1st place maki: {6 // len(maki_winners)}')
         
         if len(maki_winners) == 1:
             #now get second place as winners are masked with None
@@ -178,7 +183,8 @@ class SushiGoEnv(gym.Env):
 
             for i in maki_winners:
                 self.players[i].score += 3 // len(maki_winners)
-                logger.debug(f'Player {self.players[i].id} 2nd place maki: {3 // len(maki_winners)}')
+                if logger.get_level() <= config.DEBUG:
+                    logger.debug(f'Player {self.players[i].id} 2nd place maki: {3 // len(maki_winners)}')
 
 
     def score_round(self):
@@ -220,7 +226,8 @@ class SushiGoEnv(gym.Env):
 
 
     def pickup_chopsticks(self, player):
-        logger.debug(f'Player {player.id} picking up chopsticks')
+        if logger.get_level() <= config.DEBUG:
+            logger.debug(f'Player {player.id} picking up chopsticks')
         chopsticks = player.position.pick('chopsticks')
         player.hand.add([chopsticks])
 
@@ -229,10 +236,12 @@ class SushiGoEnv(gym.Env):
         card_name = self.contents[card_num]['info']['name']
         card = player.hand.pick(card_name)
         if card is None:
-            logger.debug(f"Player {player.id} trying to play {card_num} but doesn't exist!")
+            if logger.get_level() <= config.DEBUG:
+                logger.debug(f"Player {player.id} trying to play {card_num} but doesn't exist!")
             raise Exception('Card not found')
 
-        logger.debug(f"Player {player.id} playing {str(card.order) + ': ' + card.symbol + ': ' + str(card.id)}")
+        if logger.get_level() <= config.DEBUG:
+            logger.debug(f"Player {player.id} playing {str(card.order) + ': ' + card.symbol + ': ' + str(card.id)}")
         if card.type == 'nigiri':
             for c in player.position.cards:
                 if c.type == 'wasabi' and c.played_upon == False:
@@ -244,7 +253,8 @@ class SushiGoEnv(gym.Env):
 
 
     def switch_hands(self):
-        logger.debug(f'\nSwitching hands...')
+        if logger.get_level() <= config.DEBUG:
+            logger.debug('\nSwitching hands...')
         playernhand = self.players[-1].hand
 
         for i in range(self.n_players - 1, -1, -1):
@@ -271,7 +281,8 @@ class SushiGoEnv(gym.Env):
             self.action_bank.append(action)
 
             if len(self.action_bank) == self.n_players:
-                logger.debug(f'\nThe chosen cards are now played simultaneously')
+                if logger.get_level() <= config.DEBUG:
+                    logger.debug('\nThe chosen cards are now played simultaneously')
                 for i, action in enumerate(self.action_bank):
                     player = self.players[i]
 
@@ -333,11 +344,14 @@ class SushiGoEnv(gym.Env):
         self.current_player_num = 0
         self.done = False
         self.reset_round()
-        logger.debug(f'\n\n---- NEW GAME ----')
+        if logger.get_level() <= config.DEBUG:
+            logger.debug('\n\n---- NEW GAME ----')
         return self.observation
 
 
     def render(self, mode='human', close=False):
+        if logger.get_level() > config.DEBUG:
+            return
         
         if close:
             return
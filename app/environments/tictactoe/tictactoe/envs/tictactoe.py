@@ -24,6 +24,7 @@ class Token():
 
 class TicTacToeEnv(gym.Env):
     metadata = {'render.modes': ['human']}
+    reward_range = (-1, 1)
 
     def __init__(self, verbose = False, manual = False):
         super(TicTacToeEnv, self).__init__()
@@ -127,11 +128,14 @@ class TicTacToeEnv(gym.Env):
         self.current_player_num = 0
         self.turns_taken = 0
         self.done = False
-        logger.debug(f'\n\n---- NEW GAME ----')
+        if logger.get_level() <= config.DEBUG:
+            logger.debug('\n\n---- NEW GAME ----')
         return self.observation
 
 
     def render(self, mode='human', close=False, verbose = True):
+        if logger.get_level() > config.DEBUG:
+            return
         logger.debug('')
         if close:
             return
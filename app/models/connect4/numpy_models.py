@@ -0,0 +1,54 @@
+import numpy as np
+
+from utils.numpy_policy import conv2d, batch_normalization, dense, flatten, skip, relu
+
+# NumPy mirror of models.py - layers must be consumed in the order models.py creates them
+
+
+def forward(layers, obs):
+    extracted_features = resnet_extractor(layers, obs)
+    policy = policy_head(layers, extracted_features)
+    vf = value_head(layers, extracted_features)
+    return policy, vf
+
+
+def value_head(layers, y):
+    y = convolutional(layers, y)
+    y = flatten(y)
+    y = dense(layers, y)
+    vf = dense(layers, y, activation = 'tanh')
+    skip(layers, 'dense') # q
+    return vf
+
+
+def policy_head(layers, y):
+    y = convolutional(layers, y)
+    y = flatten(y)
+    policy = dense(layers, y, activation = None)
+    return policy
+
+
+def resnet_extractor(layers, y):
+    y = convolutional(layers, y)
+    y = residual(layers, y)
+    y = residual(layers, y)
+    y = residual(layers, y)
+    return y
+
+
+def convolutional(layers, y):
+    y = conv2d(layers, y)
+    y = batch_normalization(layers, y)
+    return relu(y)
+
+
+def residual(layers, y):
+    shortcut = y
+
+    y = conv2d(layers, y)
+    y = batch_normalization(layers, y)
+    y = relu(y)
+
+    y = conv2d(layers, y)
+    y = batch_normalization(layers, y)
+    return relu(shortcut + y)
@@ -0,0 +1,60 @@
+import numpy as np
+
+from utils.numpy_policy import conv2d, dense, flatten, skip, relu
+
+# NumPy mirror of models.py - layers must be consumed in the order models.py creates them
+
+ACTIONS = 29
+
+
+def forward(layers, obs):
+    obs, legal_actions = split_input(obs, ACTIONS)
+    extracted_features = resnet_extractor(layers, obs)
+    policy = policy_head(layers, extracted_features, legal_actions)
+    vf = value_head(layers, extracted_features)
+    return policy, vf
+
+
+def split_input(processed_obs, split):
+    obs = processed_obs[...,:-split]
+    legal_actions = np.mean(processed_obs[...,-split:], axis = (1,2))
+    return obs, legal_actions
+
+
+def value_head(layers, y):
+    y = convolutional(layers, y)
+    y = flatten(y)
+    y = dense(layers, y)
+    vf = dense(layers, y, activation = 'tanh')
+    skip(layers, 'dense') # q
+    return vf
+
+
+def policy_head(layers, y, legal_actions):
+    y = convolutional(layers, y)
+    y = flatten(y)
+    y = dense(layers, y)
+    policy = dense(layers, y, activation = None)
+    return policy + (1 - legal_actions) * -1e8
+
+
+def resnet_extractor(layers, y):
+    y = convolutional(layers, y, strides = (2,1))
+    y = residual(layers, y, strides = (2,1))
+    return y
+
+
+def convolutional(layers, y, activation = True, strides = (1,1)):
+    y = conv2d(layers, y, strides = strides)
+    if activation:
+        y = relu(y)
+    return y
+
+
+def residual(layers, y, strides):
+    shortcut = convolutional(layers, y, strides = strides)
+    shortcut = convolutional(layers, shortcut, strides = strides)
+
+    y = convolutional(layers, y, strides = strides)
+    y = convolutional(layers, y, activation = False, strides = strides)
+    return relu(shortcut + y)
@@ -0,0 +1,45 @@
+import numpy as np
+
+from utils.numpy_policy import dense, skip, relu
+
+# NumPy mirror of models.py - layers must be consumed in the order models.py creates them
+
+ACTIONS = 156
+
+
+def forward(layers, obs):
+    obs, legal_actions = split_input(obs, ACTIONS)
+    extracted_features = resnet_extractor(layers, obs)
+    policy = policy_head(layers, extracted_features, legal_actions)
+    vf = value_head(layers, extracted_features)
+    return policy, vf
+
+
+def split_input(obs, split):
+    return obs[:,:-split], obs[:,-split:]
+
+
+def value_head(layers, y):
+    y = dense(layers, y)
+    vf = dense(layers, y, activation = 'tanh')
+    skip(layers, 'dense') # q
+    return vf
+
+
+def policy_head(layers, y, legal_actions):
+    y = dense(layers, y)
+    policy = dense(layers, y, activation = None)
+    return policy + (1 - legal_actions) * -1e8
+
+
+def resnet_extractor(layers, y):
+    y = dense(layers, y)
+    y = residual(layers, y)
+    return y
+
+
+def residual(layers, y):
+    shortcut = y
+    y = dense(layers, y)
+    y = dense(layers, y, activation = None)
+    return relu(shortcut + y)
@@ -0,0 +1,115 @@
+# docker-compose exec app python3 replay.py -e tictactoe -g 0 -c
+
+import os
+import argparse
+import numpy as np
+
+from stable_baselines import logger
+
+from utils.register import get_environment
+from utils.replays import GameRandom, replay_names, read_replays
+from utils.agents import Agent
+
+import config
+
+
+def list_replays(names, directory):
+  for name in names:
+    for i, replay in enumerate(read_replays(os.path.join(directory, name))):
+      logger.info(f'{name} {i}: seed {replay.seed}, {len(replay.actions)} moves, players {replay.players}, rewards {replay.rewards}')
+
+
+def play_replay(replay, verbose, cont):
+  """
+  Rebuilds a recorded game through the env, rendering every move, and checks it ends with the recorded rewards.
+  """
+  env = get_environment(replay.env_name)(verbose = verbose)
+  players = [Agent(name) for name in replay.players]
+  game_random = GameRandom(replay.seed)
+
+  with game_random.active():
+    env.reset()
+  rewards = np.zeros(env.n_players)
+
+  for i, action in enumerate(replay.actions):
+    env.render()
+    logger.debug(f'\nMove {i + 1}: {players[env.current_player_num].name} plays {action}')
+    if replay.outputs is not None and not np.isnan(replay.outputs[i]).any():
+      players[env.current_player_num].print_top_actions(replay.outputs[i])
+
+    with game_random.active():
+      _, reward, done, _ = env.step(action)
+    rewards += reward
+
+    if cont:
+      input('Press any key to continue')
+
+  env.render()
+  env.close()
+
+  if not done or not np.allclose(rewards, replay.rewards):
+    logger.error(f'Replay diverged from the recorded game: rewards {rewards} (done {done}), recorded {replay.rewards}')
+  else:
+    logger.info(f'Replayed {len(replay.actions)} moves: rewards {rewards}')
+
+
+def main(args):
+
+  logger.configure(config.LOGDIR)
+  logger.set_level(config.DEBUG)
+
+  names = [args.file] if args.file else replay_names(args.replay_dir, args.env_name)
+  if len(names) == 0:
+    logger.info(f'No replays found for {args.env_name} in {args.replay_dir}')
+    return
+
+  if args.list:
+    list_replays(names, args.replay_dir)
+    return
+
+  # games are numbered across the shards, in shard order
+  game = 0
+  for name in names:
+    for replay in read_replays(os.path.join(args.replay_dir, name)):
+      if game == args.game:
+        play_replay(replay, args.verbose, args.cont)
+        return
+      game += 1
+
+  logger.info(f'Only {game} recorded games found')
+
+
+def cli() -> None:
+  """Handles argument extraction from CLI and passing to main().
+  Note that a separate function is used rather than in __name__ == '__main__'
+  to allow unit testing of cli().
+  """
+  # Setup argparse to show defaults on help
+  formatter_class = argparse.ArgumentDefaultsHelpFormatter
+  parser = argparse.ArgumentParser(formatter_class=formatter_class)
+
+  parser.add_argument("--env_name", "-e",  type = str, default = 'tictactoe'
+            , help="Which game's replays to read?")
+  parser.add_argument("--replay_dir", "-rd",  type = str, default = config.REPLAYDIR
+            , help="The directory of recorded games")
+  parser.add_argument("--file", "-f",  type = str, default = None
+            , help="Only read this shard of the replay directory")
+  parser.add_argument("--game", "-g", type = int, default = 0
+            , help="Which recorded game to replay")
+  parser.add_argument("--list", "-l",  action = 'store_true', default = False
+            , help="List the recorded games instead of replaying one")
+  parser.add_argument("--verbose", "-v",  action = 'store_true', default = False
+            , help="Show observation on debug logging")
+  parser.add_argument("--cont", "-c",  action = 'store_true', default = False
+            , help="Pause after each move to wait for user to continue")
+
+  # Extract args
+  args = parser.parse_args()
+
+  # Enter main
+  main(args)
+  return
+
+
+if __name__ == '__main__':
+  cli()
@@ -13,7 +13,9 @@ import argparse
 from stable_baselines import logger
 from stable_baselines.common import set_global_seeds
 
-from utils.files import load_model, write_results
+from utils.files import load_model
+from utils.results import ResultsWriter, game_result
+from utils.replays import GameRecorder
 from utils.register import get_environment
 from utils.agents import Agent
 
@@ -36,6 +38,9 @@ def main(args):
 
   total_rewards = {}
 
+  results = ResultsWriter(flush_every = args.flush_every) if args.write_results else None
+  recorder = GameRecorder(env.name, env.n_players, env.action_space.n, policy_outputs = args.record_policy, seed = args.seed) if args.record else None
+
   if args.recommend:
     ppo_model = load_model(env, 'best_model.zip')
     ppo_agent = Agent('best_model', ppo_model)
@@ -71,7 +76,12 @@ def main(args):
     if args.randomise_players:
       random.shuffle(players)
 
-    obs = env.reset()
+    game_random = recorder.start() if recorder is not None else None
+    if game_random is None:
+      obs = env.reset()
+    else:
+      with game_random.active():
+        obs = env.reset()
     done = False
     
     for i, p in enumerate(players):
@@ -103,7 +113,12 @@ def main(args):
         logger.debug(f'\n{current_player.name} model choices')
         action = current_player.choose_action(env, choose_best_action = args.best, mask_invalid_actions = True)
 
-      obs, reward, done, _ = env.step(action)
+      if game_random is None:
+        obs, reward, done, _ = env.step(action)
+      else:
+        with game_random.active():
+          obs, reward, done, _ = env.step(action)
+        recorder.record(action, reward, None if current_player.name == 'human' else current_player.action_probs)
 
       for r, player in zip(reward, players):
         total_rewards[player.id] += r
@@ -117,11 +132,19 @@ def main(args):
     logger.info(f"Played {game + 1} games: {total_rewards}")
 
     if args.write_results:
-      write_results(players, game, args.games, env.turns_taken)
+      results.add(game_result(env.name, players, game, args.games, env.turns_taken))
+
+    if game_random is not None:
+      recorder.finish([p.name for p in players])
 
     for p in players:
       p.points = 0
 
+  if results is not None:
+    results.close()
+  if recorder is not None:
+    recorder.close()
+
   env.close()
     
 
@@ -159,6 +182,12 @@ def cli() -> None:
             , help="Which game to play?")
   parser.add_argument("--write_results", "-w",  action = 'store_true', default = False
             , help="Write results to a file?")
+  parser.add_argument("--flush_every", "-fe",  type = int, default = 1000
+            , help="How many results to buffer before writing them out as a new shard")
+  parser.add_argument("--record", "-rc",  action = 'store_true', default = False
+            , help="Record the games for replay.py")
+  parser.add_argument("--record_policy", "-rp",  action = 'store_true', default = False
+            , help="Also record the policy output behind each AI move")
   parser.add_argument("--seed", "-s",  type = int, default = 17
             , help="Random seed")
 
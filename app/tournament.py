@@ -0,0 +1,148 @@
+# docker-compose exec app python3 tournament.py -e tictactoe -g 100 -r
+
+import os
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+
+import tensorflow as tf
+tf.get_logger().setLevel('INFO')
+tf.compat.v1.logging.set_verbosity(tf.compat.v1.logging.ERROR)
+
+import time
+import argparse
+import multiprocessing
+
+from stable_baselines import logger
+
+from utils.files import get_model_names, model_checksum
+from utils.register import get_environment
+from utils.matches import load_players, MatchPool
+from utils.ratings import RatingStore
+from utils.results import write_csv, write_matrix
+
+import config
+
+
+def main(args):
+
+  logger.configure(config.LOGDIR)
+  logger.set_level(config.INFO)
+
+  env_fn = lambda: get_environment(args.env_name)(verbose = False)
+  env = env_fn()
+
+  names = ['base.zip'] + get_model_names(env.name)[::-1][::args.step][::-1]
+  if args.rules:
+    names.append('rules')
+
+  logger.info(f'\nLoading {len(names)} players...')
+  models = load_players(env, names)
+
+  if args.ratings:
+    rate(args, env, env_fn, names, models)
+  else:
+    round_robin(args, env, env_fn, names, models)
+
+  env.close()
+
+
+def round_robin(args, env, env_fn, names, models):
+  matches = [(p1, p2, args.games) for p1 in names for p2 in names if args.self_play or p1 != p2]
+
+  logger.info(f'\nPlaying {len(matches)} matches of {args.games} games on {args.workers} workers...')
+  start = time.time()
+  pool = MatchPool(env_fn, models, args.workers)
+  results = {}
+  for result in pool.play(matches, best = args.best, seed = args.seed):
+    results[(result['p1'], result['p2'])] = result
+    logger.info(f"{len(results)}/{len(matches)} {result['p1']} v {result['p2']}: {result['p1_wins']}-{result['draws']}-{result['p2_wins']}")
+  pool.close()
+  logger.info(f'\nTournament took {time.time() - start:.1f}s')
+
+  os.makedirs(config.VIZDIR, exist_ok = True)
+  prefix = os.path.join(config.VIZDIR, f'tournament_{env.name}')
+  write_csv(f'{prefix}.csv', [results[match[:2]] for match in matches], list(results[matches[0][:2]].keys()))
+  write_matrix(f'{prefix}_score.csv', names, results, lambda r: r['p1_points'] / r['games'])
+  write_matrix(f'{prefix}_winrate.csv', names, results, lambda r: r['p1_wins'] / r['games'])
+  logger.info(f'Results written to {prefix}.csv, {prefix}_score.csv and {prefix}_winrate.csv')
+
+
+def rate(args, env, env_fn, names, models):
+  """
+  Incremental ratings: players already in the rating store keep their ratings, and games are only played
+  in pairings that involve a player whose rating is still uncertain, most uncertain first.
+  """
+  store = RatingStore.load(env.name)
+  keys = {}
+  for name in names:
+    keys[name] = 'rules' if name == 'rules' else model_checksum(env.name, name)
+    store.add(keys[name], name)
+  names_by_key = {key: name for name, key in keys.items()}
+
+  pool = MatchPool(env_fn, models, args.workers)
+  start = time.time()
+  total_games = 0
+  for round in range(args.max_rounds):
+    pairings = store.schedule(list(keys.values()), args.workers, args.target_rd)
+    if len(pairings) == 0:
+      break
+    # alternate who takes the first seat, since p1 and p2 aren't symmetric
+    matches = [(names_by_key[a], names_by_key[b], args.games) if (round + i) % 2 == 0 else (names_by_key[b], names_by_key[a], args.games) for i, (a, b) in enumerate(pairings)]
+    for result in pool.play(matches, best = args.best, seed = args.seed + round * len(matches)):
+      store.update(keys[result['p1']], keys[result['p2']], result['p1_wins'], result['draws'], result['p2_wins'])
+      total_games += result['games']
+    store.save()
+    logger.info(f'Round {round + 1}: {len(matches)} matches, largest rd {max(store.ratings[key]["rd"] for key in keys.values()):.0f}')
+  pool.close()
+  logger.info(f'\nRating took {time.time() - start:.1f}s and {total_games} games')
+
+  rows = [dict(key = key, **entry) for key, entry in store.table() if key in names_by_key]
+  os.makedirs(config.VIZDIR, exist_ok = True)
+  filename = os.path.join(config.VIZDIR, f'ratings_{env.name}.csv')
+  write_csv(filename, rows, ['name', 'rating', 'rd', 'games', 'key'])
+  for row in rows:
+    logger.info(f"{row['name']}: {row['rating']:.0f} +/- {row['rd']:.0f} ({row['games']} games)")
+  logger.info(f'Ratings written to {filename}')
+
+
+def cli() -> None:
+  """Handles argument extraction from CLI and passing to main().
+  Note that a separate function is used rather than in __name__ == '__main__'
+  to allow unit testing of cli().
+  """
+  # Setup argparse to show defaults on help
+  formatter_class = argparse.ArgumentDefaultsHelpFormatter
+  parser = argparse.ArgumentParser(formatter_class=formatter_class)
+
+  parser.add_argument("--env_name", "-e",  type = str, default = 'tictactoe'
+            , help="Which game to play?")
+  parser.add_argument("--games", "-g", type = int, default = 100
+            , help="Number of games per pairing")
+  parser.add_argument("--step", "-st", type = int, default = 1
+            , help="Only include every step-th generation, counting back from the newest")
+  parser.add_argument("--rules", "-r",  action = 'store_true', default = False
+            , help="Include the rules-based agent")
+  parser.add_argument("--self_play", "-sp",  action = 'store_true', default = False
+            , help="Also play each model against itself")
+  parser.add_argument("--ratings", "-ra",  action = 'store_true', default = False
+            , help="Update the stored ratings incrementally instead of playing a full round robin")
+  parser.add_argument("--target_rd", "-td", type = float, default = 60
+            , help="With --ratings, play until every player's rating deviation is below this")
+  parser.add_argument("--max_rounds", "-mr", type = int, default = 50
+            , help="With --ratings, the most rounds of matches to play")
+  parser.add_argument("--best", "-b", action = 'store_true', default = False
+            , help="Make AI agents choose the best move (rather than sampling)")
+  parser.add_argument("--workers", "-nw", type = int, default = multiprocessing.cpu_count()
+            , help="Number of worker processes")
+  parser.add_argument("--seed", "-s",  type = int, default = 17
+            , help="Random seed")
+
+  # Extract args
+  args = parser.parse_args()
+
+  # Enter main
+  main(args)
+  return
+
+
+if __name__ == '__main__':
+  cli()
@@ -9,24 +9,55 @@ tf.compat.v1.logging.set_verbosity(tf.compat.v1.logging.ERROR)
 
 
 import argparse
+import json
 import time
+from functools import partial
 from shutil import copyfile
 from mpi4py import MPI
 
-from stable_baselines.ppo1 import PPO1
 from stable_baselines.common.callbacks import EvalCallback
 
 from stable_baselines.common.vec_env import DummyVecEnv
 from stable_baselines.common import set_global_seeds
 from stable_baselines import logger
 
-from utils.callbacks import SelfPlayCallback
-from utils.files import reset_logs, reset_models
+from utils.callbacks import SelfPlayCallback, LiveWeightsCallback
+from utils.files import reset_logs, reset_models, init_manifest
 from utils.register import get_network_arch, get_environment
 from utils.selfplay import selfplay_wrapper
+from utils.registry import registry
+from utils.ppo import SelfPlayPPO1
+from utils.runners import selfplay_segment_generator
+from utils.workers import SelfPlayWorkers
+from utils.actors import Actors, actor_segment_generator
+from utils.evaluation import EvaluationPool
+from utils.timing import timers
+from utils.memory import MemoryMonitor, peak_rss
 
 import config
 
+def write_stats(filename, model, learn_seconds):
+  """
+  Writes the throughput of a run for benchmark.py: timesteps per second of learn(), the evaluation wall time
+  and the peak resident memory, each the largest over the ranks. A collective, so every rank must call it.
+  """
+  evaluation = timers.elapsed('evaluation') if timers.enabled else None
+  gathered = MPI.COMM_WORLD.allgather((learn_seconds, evaluation, peak_rss()))
+
+  if MPI.COMM_WORLD.Get_rank() == 0:
+    learn_seconds = max(seconds for seconds, _, _ in gathered)
+    stats = {
+      'ranks': len(gathered),
+      'timesteps': int(model.num_timesteps),
+      'learn_seconds': learn_seconds,
+      'timesteps_per_second': model.num_timesteps / learn_seconds,
+      'evaluation_seconds': None if evaluation is None else max(seconds for _, seconds, _ in gathered),
+      'peak_rss_mb': max(rss for _, _, rss in gathered) / 1e6
+    }
+    with open(filename, 'w') as f:
+      json.dump(stats, f, indent = 2)
+
+
 def main(args):
 
   rank = MPI.COMM_WORLD.Get_rank()
@@ -41,6 +72,7 @@ def main(args):
     reset_logs(model_dir)
     if args.reset:
       reset_models(model_dir)
+    init_manifest(args.env_name)
     logger.configure(config.LOGDIR)
   else:
     logger.configure(format_strs=[])
@@ -54,11 +86,44 @@ def main(args):
   workerseed = args.seed + 10000 * MPI.COMM_WORLD.Get_rank()
   set_global_seeds(workerseed)
 
+  registry.configure(args.opponent_memory, args.memory_limit)
+  timers.enable(args.timing)
+
   logger.info('\nSetting up the selfplay training environment opponents...')
   base_env = get_environment(args.env_name)
-  env = selfplay_wrapper(base_env)(opponent_type = args.opponent_type, verbose = args.verbose)
+  selfplay_args = {
+    'verbose' : args.verbose,
+    'numpy_opponents' : args.numpy_opponents,
+    'pfsp_weighting' : args.pfsp_weighting,
+    'pfsp_exponent' : args.pfsp_exponent
+  }
+  record_args = {'record_rate' : args.record_rate, 'record_policy' : args.record_policy}
+  env = selfplay_wrapper(base_env)(opponent_type = args.opponent_type, all_seats = args.all_seats, **selfplay_args, **record_args)
   env.seed(workerseed)
 
+  # worker and actor games always use NumPy opponents, so that no subprocess builds a TF graph
+  worker_args = dict(selfplay_args, numpy_opponents = True)
+  make_env = lambda: selfplay_wrapper(base_env)(opponent_type = args.opponent_type, all_seats = args.all_seats, **worker_args, **record_args)
+
+  # playing the live policy against itself always scores evens, so 'self' training is evaluated against the best generation
+  eval_opponent_type = 'best' if args.opponent_type == 'self' else args.opponent_type
+
+  eval_pool = None
+  if args.eval_workers > 0:
+    eval_env_fns = {'selfplay': lambda: selfplay_wrapper(base_env)(opponent_type = eval_opponent_type, **worker_args)}
+    if args.rules:
+      eval_env_fns['rules'] = lambda: selfplay_wrapper(base_env)(opponent_type = 'rules', **worker_args)
+    eval_pool = EvaluationPool(eval_env_fns, args.eval_workers, seed = workerseed)
+
+  record_policy = args.record_rate > 0 and args.record_policy
+  segment_generator = None
+  if args.n_envs > 1:
+    games = SelfPlayWorkers([make_env] * args.n_envs, env.observation_space, env.n_players, seed = workerseed, live = args.opponent_type == 'self', games_per_worker = args.games_per_worker, record_policy = record_policy)
+    segment_generator = partial(selfplay_segment_generator, games = games)
+  elif args.all_seats or record_policy:
+    # stable_baselines' own generator steps the env with actions alone, so the learner's policy outputs couldn't be recorded
+    segment_generator = selfplay_segment_generator
+
   
   CustomPolicy = get_network_arch(args.env_name)
 
@@ -74,35 +139,48 @@ def main(args):
       , 'schedule':'linear'
       , 'verbose':1
       , 'tensorboard_log':config.LOGDIR
+      , 'segment_generator':segment_generator
   }
 
   time.sleep(5) # allow time for the base model to be saved out when the environment is created
 
   if args.reset or not os.path.exists(os.path.join(model_dir, 'best_model.zip')):
     logger.info('\nLoading the base PPO agent to train...')
-    model = PPO1.load(os.path.join(model_dir, 'base.zip'), env, **params)
+    model = SelfPlayPPO1.load(os.path.join(model_dir, 'base.zip'), env, **params)
   else:
     logger.info('\nLoading the best_model.zip PPO agent to continue training...')
-    model = PPO1.load(os.path.join(model_dir, 'best_model.zip'), env, **params)
+    model = SelfPlayPPO1.load(os.path.join(model_dir, 'best_model.zip'), env, **params)
+
+  if args.actors > 0:
+    logger.info(f'\nStarting {args.actors} actor processes...')
+    actors = Actors([make_env] * args.actors, model, args.actor_steps, max_staleness = args.max_staleness, seed = workerseed, live = args.opponent_type == 'self')
+    model.segment_generator = partial(actor_segment_generator, actors = actors)
+
+  # the prefetch thread starts after every worker, evaluator and actor process is forked,
+  # so no child can inherit the registry lock while the thread holds it
+  if args.prefetch:
+    registry.start_prefetch(env, numpy_model = args.numpy_opponents)
 
   #Callbacks
   logger.info('\nSetting up the selfplay evaluation environment opponents...')
   callback_args = {
-    'eval_env': selfplay_wrapper(base_env)(opponent_type = args.opponent_type, verbose = args.verbose),
-    'best_model_save_path' : config.TMPMODELDIR,
+    'eval_env': selfplay_wrapper(base_env)(opponent_type = eval_opponent_type, **selfplay_args),
     'log_path' : config.LOGDIR,
     'eval_freq' : args.eval_freq,
     'n_eval_episodes' : args.n_eval_episodes,
     'deterministic' : False,
     'render' : True,
-    'verbose' : 0
+    'verbose' : 0,
+    'eval_pool' : eval_pool,
+    'eval_alpha' : args.eval_alpha,
+    'eval_batch' : args.eval_batch
   }
 
   if args.rules:  
     logger.info('\nSetting up the evaluation environment against the rules-based agent...')
     # Evaluate against a 'rules' agent as well
     eval_actual_callback = EvalCallback(
-      eval_env = selfplay_wrapper(base_env)(opponent_type = 'rules', verbose = args.verbose),
+      eval_env = selfplay_wrapper(base_env)(opponent_type = 'rules', **selfplay_args),
       eval_freq=1,
       n_eval_episodes=args.n_eval_episodes,
       deterministic = args.best,
@@ -112,15 +190,33 @@ def main(args):
     callback_args['callback_on_new_best'] = eval_actual_callback
     
   # Evaluate the agent against previous versions
-  eval_callback = SelfPlayCallback(args.opponent_type, args.threshold, args.env_name, **callback_args)
+  eval_callback = SelfPlayCallback(eval_opponent_type, args.threshold, args.env_name, **callback_args)
+  callbacks = [eval_callback]
+
+  eval_envs = [eval_callback.eval_env] + ([eval_actual_callback.eval_env] if args.rules else [])
+  eval_callback.memory_monitor = MemoryMonitor(registry, env, eval_envs, args.timesteps_per_actorbatch)
+
+  if args.opponent_type == 'self':
+    callbacks.append(LiveWeightsCallback(env, numpy_model = args.numpy_opponents, sync_freq = args.live_sync_freq))
 
   logger.info('\nSetup complete - commencing learning...\n')
 
-  model.learn(total_timesteps=int(1e9), callback=[eval_callback], reset_num_timesteps = False, tb_log_name="tb")
+  start = time.perf_counter()
+  model.learn(total_timesteps=args.total_timesteps, callback=callbacks, reset_num_timesteps = False, tb_log_name="tb")
+  learn_seconds = time.perf_counter() - start
 
   env.close()
+  if args.n_envs > 1:
+    games.close()
+  if args.actors > 0:
+    actors.close()
+  if eval_pool is not None:
+    eval_pool.close()
   del env
 
+  if args.stats_file:
+    write_stats(args.stats_file, model, learn_seconds)
+
 
 def cli() -> None:
   """Handles argument extraction from CLI and passing to main().
@@ -135,7 +231,41 @@ def cli() -> None:
   parser.add_argument("--reset", "-r", action = 'store_true', default = False
                 , help="Start retraining the model from scratch")
   parser.add_argument("--opponent_type", "-o", type = str, default = 'mostly_best'
-              , help="best / mostly_best / random / base / rules - the type of opponent to train against")
+              , help="best / mostly_best / random / base / rules / pfsp / self - the type of opponent to train against")
+  parser.add_argument("--all_seats", "-as", action = 'store_true', default = False
+              , help="Collect training samples from every seat played by the current policy - all seats with -o self")
+  parser.add_argument("--n_envs", "-nv", type = int, default = 1
+              , help="Number of self-play games per MPI rank, played in worker processes and batched through the learner - opponent moves are only batched with -gw > 1")
+  parser.add_argument("--games_per_worker", "-gw", type = int, default = 1
+              , help="Self-play games per worker process (with -nv > 1) - their opponent moves are batched through one forward pass per opponent model, where 1 plays every opponent move on its own")
+  parser.add_argument("--actors", "-na", type = int, default = 0
+              , help="Number of actor processes playing games alongside the learner (0 = the learner collects its own rollouts)")
+  parser.add_argument("--actor_steps", "-at", type = int, default = 256
+              , help="Transitions per segment sent by an actor to the learner")
+  parser.add_argument("--max_staleness", "-ms", type = int, default = 1
+              , help="Drop actor segments played by a policy more than this many updates old")
+  parser.add_argument("--eval_workers", "-ew", type = int, default = 0
+              , help="Number of worker processes that evaluate snapshots of the model while training carries on (0 = evaluate in-process)")
+  parser.add_argument("--eval_alpha", "-ea", type = float, default = 0
+              , help="Error rate of the sequential test that can settle a promotion before n_eval_episodes are played (0 = always play them all)")
+  parser.add_argument("--eval_batch", "-eb", type = int, default = 10
+              , help="Episodes per rank between looks of the sequential promotion test")
+  parser.add_argument("--live_sync_freq", "-ls", type = int, default = 1000
+              , help="How many steps between refreshes of the NumPy copy of the live policy used by the 'self' opponent")
+  parser.add_argument("--pfsp_weighting", "-pw", type = str, default = 'hard'
+              , help="hard / variance / linear - how pfsp prioritises generations by the agent's win rate against them")
+  parser.add_argument("--pfsp_exponent", "-pe", type = float, default = 2.0
+              , help="The exponent p in the pfsp 'hard' weighting (1 - win rate) ^ p")
+  parser.add_argument("--record_rate", "-rr", type = float, default = 0
+              , help="Fraction of training games to record for replay.py (0 = none)")
+  parser.add_argument("--record_policy", "-rp", action = 'store_true', default = False
+              , help="Also record the opponent policy output behind each recorded move")
+  parser.add_argument("--timing", "-tm", action = 'store_true', default = False
+              , help="Log the time each rank spends per phase of training (env, opponents, model loading, update, evaluation, MPI)")
+  parser.add_argument("--total_timesteps", "-tt", type = int, default = int(1e9)
+              , help="Stop training after this many timesteps, summed over the ranks")
+  parser.add_argument("--stats_file", "-sf", type = str, default = None
+              , help="Write timesteps/s, evaluation time and peak memory of the run to this JSON file when training stops")
   parser.add_argument("--debug", "-d", action = 'store_true', default = False
               , help="Debug logging")
   parser.add_argument("--verbose", "-v", action = 'store_true', default = False
@@ -144,6 +274,14 @@ def cli() -> None:
               , help="Evaluate on a ruled-based agent")
   parser.add_argument("--best", "-b", action = 'store_true', default = False
               , help="Uses best moves when evaluating agent against rules-based agent")
+  parser.add_argument("--numpy_opponents", "-no", action = 'store_true', default = False
+              , help="Run the opponent models as NumPy forward passes instead of TF sessions")
+  parser.add_argument("--opponent_memory", "-om", type = float, default = None
+              , help="Memory budget in MB for the opponent models cached in each process (unbounded if not set)")
+  parser.add_argument("--memory_limit", "-ml", type = float, default = None
+              , help="Resident memory limit in MB per process - opponent models are evicted while it is exceeded (unlimited if not set)")
+  parser.add_argument("--prefetch", "-pf", action = 'store_true', default = False
+              , help="Load new opponent generations in a background thread")
   parser.add_argument("--env_name", "-e", type = str, default = 'tictactoe'
               , help="Which gym environment to train in: tictactoe, connect4, sushigo, butterfly, geschenkt, frouge")
   parser.add_argument("--seed", "-s",  type = int, default = 17
@@ -0,0 +1,169 @@
+import random
+import multiprocessing
+import numpy as np
+from collections import OrderedDict
+
+from utils.numpy_policy import NumpyModel
+from utils.runners import Trajectories
+from utils.workers import SelfPlayGames
+from utils.timing import timers
+
+from stable_baselines import logger
+
+
+class SharedParameters():
+    """
+    The learner's policy weights in shared memory, with a version number that is bumped on every publish.
+    Allocated before the actors are forked, so publishing is a single write and never goes through a pipe.
+    """
+    def __init__(self, ctx, params):
+        self.shapes = OrderedDict((name, value.shape) for name, value in params.items())
+        size = sum(int(np.prod(shape)) for shape in self.shapes.values())
+        self.flat = np.frombuffer(ctx.RawArray('f', size), dtype = np.float32)
+        self.version = ctx.RawValue('i', 0)
+        self.lock = ctx.Lock()
+        self.publish(params)
+
+    def publish(self, params):
+        with self.lock:
+            self.flat[:] = np.concatenate([np.ravel(params[name]) for name in self.shapes])
+            self.version.value += 1
+
+    def read(self):
+        with self.lock:
+            version = self.version.value
+            flat = self.flat.copy()
+
+        params = OrderedDict()
+        start = 0
+        for name, shape in self.shapes.items():
+            end = start + int(np.prod(shape))
+            params[name] = flat[start:end].reshape(shape)
+            start = end
+        return version, params
+
+
+def actor(queue, parameters, stopped, env_fn, seed, n_steps, gamma, live):
+    random.seed(seed)
+    np.random.seed(seed)
+    env = env_fn()
+    games = SelfPlayGames([env])
+    trajectories = Trajectories(gamma)
+    seats = range(games.n_players)
+
+    def refresh():
+        version, params = parameters.read()
+        if live:
+            env.set_live_parameters(params)
+        return version, NumpyModel(env.name, env.observation_space, params).policy_pi
+
+    version, policy = refresh()
+    # a segment can include transitions opened before the last refresh, so it is tagged with the oldest version that played it
+    segment_version = version
+    observations, players = games.reset()
+
+    while not stopped.is_set():
+        with timers.time('policy_inference'):
+            actions, vpreds, _, _ = policy.step(observations)
+            policy_outputs = policy.proba_step(observations) if games.record_policy else None
+        for i, (observation, player, action, vpred) in enumerate(zip(observations, players, actions, vpreds)):
+            trajectories.act((i, player), observation, action, vpred)
+
+        observations, players, rewards, dones = games.step(actions, policy_outputs)
+
+        keys = [(0, seat) for seat in seats]
+        trajectories.reward(rewards[0], keys)
+        if dones[0]:
+            trajectories.end_episode(keys)
+
+        if len(trajectories) >= n_steps:
+            queue.put((segment_version, trajectories.segment(), timers.collect()))
+            segment_version = version
+            if parameters.version.value != version:
+                version, policy = refresh()
+
+
+class Actors():
+    """
+    Actor processes that play SelfPlayEnv games continuously with a NumPy copy of the policy,
+    and put segments of n_steps transitions, tagged with the parameter version that played them, on a queue.
+    The learner publishes its weights back through SharedParameters after every update and
+    drops segments played by a policy more than max_staleness updates old.
+    The queue is bounded, so actors that get too far ahead block instead of piling up stale data.
+    """
+    def __init__(self, env_fns, model, n_steps, max_staleness = 1, seed = 0, live = False):
+        self.max_staleness = max_staleness
+        ctx = multiprocessing.get_context('fork')
+        self.parameters = SharedParameters(ctx, model.get_parameters())
+        self.queue = ctx.Queue(maxsize = 2 * len(env_fns))
+        self.stopped = ctx.Event()
+        self.processes = []
+        for i, env_fn in enumerate(env_fns):
+            process = ctx.Process(target = actor, args = (self.queue, self.parameters, self.stopped, env_fn, seed + i, n_steps, model.gamma, live), daemon = True)
+            process.start()
+            self.processes.append(process)
+        self.dropped = 0
+
+    @property
+    def version(self):
+        return self.parameters.version.value
+
+    def publish(self, model):
+        self.parameters.publish(model.get_parameters())
+
+    def get(self):
+        # the next segment within the staleness bound
+        while True:
+            version, seg, totals = self.queue.get()
+            # a dropped segment's time was still spent
+            timers.merge(totals)
+            if self.version - version <= self.max_staleness:
+                return seg
+            self.dropped += 1
+
+    def close(self):
+        self.stopped.set()
+        for process in self.processes:
+            process.terminate()
+            process.join()
+
+
+def merge_segments(segs, continue_training = True):
+    # every actor segment starts on an episode boundary and is fully bootstrapped, so they simply concatenate
+    seg = {}
+    for key in ["observations", "rewards", "dones", "episode_starts", "true_rewards", "vpred", "actions"]:
+        seg[key] = np.concatenate([s[key] for s in segs])
+    for key in ["ep_rets", "ep_lens", "ep_true_rets"]:
+        seg[key] = [x for s in segs for x in s[key]]
+    seg["nextvpred"] = 0
+    seg["total_timestep"] = sum(s["total_timestep"] for s in segs)
+    seg["continue_training"] = continue_training
+    return seg
+
+
+def actor_segment_generator(model, env, horizon, callback, actors = None):
+    """
+    Segment generator for SelfPlayPPO1 that takes its experience from Actors instead of playing games itself,
+    so simulation carries on while the learner optimises.
+    Each time the learner asks for the next segment, its updated weights are published to the actors first.
+    """
+    callback.on_rollout_start()
+
+    while True:
+        segs = []
+        n = 0
+        while n < horizon:
+            seg = actors.get()
+            segs.append(seg)
+            n += seg["total_timestep"]
+            callback.update_locals(locals())
+            for _ in range(seg["total_timestep"]):
+                if callback.on_step() is False:
+                    yield merge_segments(segs, continue_training = False)
+                    return
+
+        callback.on_rollout_end()
+        logger.record_tabular("ActorSegmentsDropped", actors.dropped)
+        yield merge_segments(segs)
+        actors.publish(model)
+        callback.on_rollout_start()
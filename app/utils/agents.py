@@ -28,8 +28,12 @@ class Agent():
       self.id = self.name + '_' + ''.join(random.choice(string.ascii_lowercase) for x in range(5))
       self.model = model
       self.points = 0
+      self.action_probs = None
+      self.batch_action_probs = None
 
   def print_top_actions(self, action_probs):
+    if logger.get_level() > config.DEBUG:
+      return
     top5_action_idx = np.argsort(-action_probs)[:5]
     top5_actions = action_probs[top5_action_idx]
     logger.debug(f"Top 5 actions: {[str(i) + ': ' + str(round(a,2))[:5] for i,a in zip(top5_action_idx, top5_actions)]}")
@@ -40,9 +44,32 @@ class Agent():
         value = None
       else:
         action_probs = self.model.action_probability(env.observation)
-        value = self.model.policy_pi.value(np.array([env.observation]))[0]
-        logger.debug(f'Value {value:.2f}')
+        if logger.get_level() <= config.DEBUG:
+          # the value estimate is a second forward pass, only needed for the debug output
+          value = self.model.policy_pi.value(np.array([env.observation]))[0]
+          logger.debug(f'Value {value:.2f}')
 
+      return self.select_action(env, action_probs, choose_best_action, mask_invalid_actions)
+
+  def choose_actions(self, envs, choose_best_action, mask_invalid_actions):
+      # one batched forward pass for a group of games that are all waiting on this agent's model
+      # the policy output behind each action is kept in batch_action_probs, in the same order
+      if self.name == 'rules':
+        actions = []
+        self.batch_action_probs = []
+        for env in envs:
+          actions.append(self.choose_action(env, choose_best_action, mask_invalid_actions))
+          self.batch_action_probs.append(self.action_probs)
+        return actions
+
+      batch_action_probs = self.model.action_probability(np.array([env.observation for env in envs]))
+      actions = [self.select_action(env, probs, choose_best_action, mask_invalid_actions) for env, probs in zip(envs, batch_action_probs)]
+      self.batch_action_probs = list(batch_action_probs)
+      return actions
+
+  def select_action(self, env, action_probs, choose_best_action, mask_invalid_actions):
+      # the unmasked policy output behind the last action chosen, kept for game recording
+      self.action_probs = action_probs
       self.print_top_actions(action_probs)
       
       if mask_invalid_actions:
@@ -51,11 +78,14 @@ class Agent():
         self.print_top_actions(action_probs)
         
       action = np.argmax(action_probs)
-      logger.debug(f'Best action {action}')
+      debug = logger.get_level() <= config.DEBUG
+      if debug:
+        logger.debug(f'Best action {action}')
 
       if not choose_best_action:
           action = sample_action(action_probs)
-          logger.debug(f'Sampled action {action} chosen')
+          if debug:
+            logger.debug(f'Sampled action {action} chosen')
 
       return action
 
@@ -1,21 +1,41 @@
 import os
+import threading
 import numpy as np
-from shutil import copyfile
+from collections import OrderedDict
 from mpi4py import MPI
 
-from stable_baselines.common.callbacks import EvalCallback
+from stable_baselines.common.callbacks import BaseCallback, EvalCallback
+from stable_baselines.common.evaluation import evaluate_policy
 from stable_baselines import logger
 
-from utils.files import get_best_model_name, get_model_stats
+from utils.files import get_best_model_stats, publish_model, model_filename
+from utils.registry import registry
+from utils.numpy_policy import NumpyModel
+from utils.evaluation import Evaluation, CompletedResult, SequentialTest
+from utils.timing import timers
 
 import config
 
+
+def allgather(value):
+  with timers.time('mpi'):
+    return MPI.COMM_WORLD.allgather(value)
+
+
 class SelfPlayCallback(EvalCallback):
-  def __init__(self, opponent_type, threshold, env_name, *args, **kwargs):
+  def __init__(self, opponent_type, threshold, env_name, *args, eval_pool = None, eval_alpha = 0, eval_batch = 10, memory_monitor = None, **kwargs):
     super(SelfPlayCallback, self).__init__(*args, **kwargs)
     self.opponent_type = opponent_type
+    self.env_name = env_name
     self.model_dir = os.path.join(config.MODELDIR, env_name)
-    self.generation, self.base_timesteps, pbmr, bmr = get_model_stats(get_best_model_name(env_name))
+    self.generation, self.base_timesteps, pbmr, bmr = get_best_model_stats(env_name)
+    self.eval_pool = eval_pool
+    self.eval_alpha = eval_alpha
+    self.eval_batch = eval_batch
+    self.memory_monitor = memory_monitor
+    self.eval_requested = False
+    self.evaluation = None
+    self.publisher = None
 
     #reset best_mean_reward because this is what we use to extract the rewards from the latest evaluation by each agent
     self.best_mean_reward = -np.inf
@@ -29,54 +49,205 @@ class SelfPlayCallback(EvalCallback):
 
 
   def _on_step(self) -> bool:
-
     if self.eval_freq > 0 and self.n_calls % self.eval_freq == 0:
+      self.eval_requested = True
+    return True
+
+
+  def _on_rollout_end(self) -> None:
+    # evaluations start and finish between rollouts, where every rank is at the same iteration,
+    # so the collective calls below line up however many steps each rank's rollout took
+    with timers.time('evaluation'):
+      if self.evaluation is None and any(allgather(self.eval_requested)):
+        self.start_evaluation()
+
+      while self.evaluation is not None and all(allgather(self.evaluation.ready())):
+        if not self.continue_evaluation():
+          self.finish_evaluation()
+
+
+  def submit(self, key, params, n_eval_episodes):
+    if key == 'rules':
+      eval_env, deterministic = self.callback.eval_env, self.callback.deterministic
+    else:
+      eval_env, deterministic = self.eval_env, self.deterministic
+
+    if self.eval_pool is None: # in-process, straight away - the model can't have moved on from params yet
+      return [CompletedResult(evaluate_policy(self.model, eval_env, n_eval_episodes = n_eval_episodes, render = self.render, deterministic = deterministic, return_episode_rewards = True))]
+    return self.eval_pool.submit(key, params, n_eval_episodes, deterministic, self.render)
+
+
+  def start_evaluation(self):
+    self.eval_requested = False
+    params = self.model.get_parameters()
+    results = {}
+
+    if self.eval_alpha > 0:
+      # played in batches until the sequential test settles the promotion or n_eval_episodes are used up
+      results['selfplay'] = self.submit('selfplay', params, min(self.eval_batch, self.n_eval_episodes))
+      low, high = self.eval_env.get_attr('reward_range')[0]
+      if not np.isfinite(low) or not np.isfinite(high):
+        raise Exception(f'{self.env_name} needs a finite reward_range for the sequential promotion test (eval_alpha)')
+      test = SequentialTest(self.threshold, self.eval_alpha, low, high)
+    else:
+      results['selfplay'] = self.submit('selfplay', params, self.n_eval_episodes)
+      test = None
+
+    if self.callback is not None:
+      results['rules'] = self.submit('rules', params, self.callback.n_eval_episodes)
+
+    self.evaluation = Evaluation(params, self.num_timesteps, results, test)
+
+
+  def continue_evaluation(self):
+    # returns True if another batch of episodes has been submitted
+    evaluation = self.evaluation
+    if evaluation.test is None:
+      return False
+
+    episode_rewards, _ = evaluation.get('selfplay')
+    tallies = allgather((np.sum(episode_rewards), len(episode_rewards)))
+    total, n = np.sum(tallies, axis = 0)
+    evaluation.decision = evaluation.test.decide(total, n)
+
+    remaining = self.n_eval_episodes - len(episode_rewards)
+    if evaluation.decision is None and remaining > 0:
+      evaluation.results['selfplay'] += self.submit('selfplay', evaluation.params, min(self.eval_batch, remaining))
+      return True
+
+    if MPI.COMM_WORLD.Get_rank() == 0 and evaluation.decision is not None:
+      logger.info(f"Sequential test settled after {int(n)} episodes: {'pass' if evaluation.decision else 'fail'}")
+    return False
+
+
+  def finish_evaluation(self):
+    evaluation, self.evaluation = self.evaluation, None
+    episode_rewards, episode_lengths = evaluation.get('selfplay')
+
+    if self.log_path is not None:
+      self.evaluations_timesteps.append(evaluation.num_timesteps)
+      self.evaluations_results.append(episode_rewards)
+      self.evaluations_length.append(episode_lengths)
+      np.savez(self.log_path, timesteps=self.evaluations_timesteps, results=self.evaluations_results, ep_lengths=self.evaluations_length)
+
+    self.best_mean_reward = self.last_mean_reward = np.mean(episode_rewards)
+    if self.callback is not None:
+      self.callback.best_mean_reward = self.callback.last_mean_reward = np.mean(evaluation.get('rules')[0])
+
+    list_of_rewards = allgather(self.best_mean_reward)
+    av_reward = np.mean(list_of_rewards)
+    std_reward = np.std(list_of_rewards)
+    total_episodes = np.sum(allgather(len(episode_rewards)))
+
+    if self.callback is not None:
+      rules_based_rewards = allgather(self.callback.best_mean_reward)
+      av_rules_based_reward = np.mean(rules_based_rewards)
 
-      result = super(SelfPlayCallback, self)._on_step() #this will set self.best_mean_reward to the reward from the evaluation as it's previously -np.inf
-
-      list_of_rewards = MPI.COMM_WORLD.allgather(self.best_mean_reward)
-      av_reward = np.mean(list_of_rewards)
-      std_reward = np.std(list_of_rewards)
-      av_timesteps = np.mean(MPI.COMM_WORLD.allgather(self.num_timesteps))
-      total_episodes = np.sum(MPI.COMM_WORLD.allgather(self.n_eval_episodes))
-
-      if self.callback is not None:
-        rules_based_rewards = MPI.COMM_WORLD.allgather(self.callback.best_mean_reward)
-        av_rules_based_reward = np.mean(rules_based_rewards)
-
-      rank = MPI.COMM_WORLD.Get_rank()
-      if rank == 0:
-        logger.info("Eval num_timesteps={}, episode_reward={:.2f} +/- {:.2f}".format(self.num_timesteps, av_reward, std_reward))
-        logger.info("Total episodes ran={}".format(total_episodes))
-
-      #compare the latest reward against the threshold
-      if result and av_reward > self.threshold:
-        self.generation += 1
-        if rank == 0: #write new files
-          logger.info(f"New best model: {self.generation}\n")
-
-          generation_str = str(self.generation).zfill(5)
-          av_rewards_str = str(round(av_reward,3))
-
-          if self.callback is not None:
-            av_rules_based_reward_str = str(round(av_rules_based_reward,3))
-          else:
-            av_rules_based_reward_str = str(0)
-          
-          source_file = os.path.join(config.TMPMODELDIR, f"best_model.zip") # this is constantly being written to - not actually the best model
-          target_file = os.path.join(self.model_dir,  f"_model_{generation_str}_{av_rules_based_reward_str}_{av_rewards_str}_{str(self.base_timesteps + self.num_timesteps)}_.zip")
-          copyfile(source_file, target_file)
-          target_file = os.path.join(self.model_dir,  f"best_model.zip")
-          copyfile(source_file, target_file)
-
-        # if playing against a rules based agent, update the global best reward to the improved metric
-        if self.opponent_type == 'rules':
-          self.threshold  = av_reward
-        
-      #reset best_mean_reward because this is what we use to extract the rewards from the latest evaluation by each agent
-      self.best_mean_reward = -np.inf
-
-      if self.callback is not None: #if evaling against rules-based agent as well, reset this too
-        self.callback.best_mean_reward = -np.inf
-
-    return True
\ No newline at end of file
+    rank = MPI.COMM_WORLD.Get_rank()
+    if rank == 0:
+      logger.info("Eval num_timesteps={}, episode_reward={:.2f} +/- {:.2f}".format(evaluation.num_timesteps, av_reward, std_reward))
+      logger.info("Total episodes ran={}".format(total_episodes))
+
+    #compare the latest reward against the threshold - settled early by the sequential test if it reached a decision
+    if evaluation.decision is not None:
+      promote = evaluation.decision
+    else:
+      promote = av_reward > self.threshold
+
+    if promote:
+      self.generation += 1
+      filename = None
+      if rank == 0: #write new files
+        logger.info(f"New best model: {self.generation}\n")
+
+        av_rewards_str = str(round(av_reward,3))
+
+        if self.callback is not None:
+          av_rules_based_reward_str = str(round(av_rules_based_reward,3))
+        else:
+          av_rules_based_reward_str = str(0)
+
+        filename = model_filename(self.generation, av_rules_based_reward_str, av_rewards_str, self.base_timesteps + evaluation.num_timesteps)
+        self.publish(filename, evaluation.params)
+
+      # every rank gains the new generation from memory instead of re-reading the zip from the shared filesystem
+      with timers.time('mpi'):
+        filename = MPI.COMM_WORLD.bcast(filename, root = 0)
+      self.broadcast_parameters(filename, evaluation.params)
+
+      # if playing against a rules based agent, update the global best reward to the improved metric
+      if self.opponent_type == 'rules':
+        self.threshold  = av_reward
+
+    #reset best_mean_reward because this is what we use to extract the rewards from the latest evaluation by each agent
+    self.best_mean_reward = -np.inf
+
+    if self.callback is not None: #if evaling against rules-based agent as well, reset this too
+      self.callback.best_mean_reward = -np.inf
+
+    if self.memory_monitor is not None:
+      self.memory_monitor.log()
+
+
+  def publish(self, filename, params):
+    # writes the evaluated snapshot in the background - the ranks already share it in memory via broadcast_parameters
+    self.wait_for_publish()
+    self.publisher = threading.Thread(target = publish_model, args = (self.model, self.env_name, filename, params))
+    self.publisher.start()
+
+
+  def wait_for_publish(self):
+    if self.publisher is not None:
+      self.publisher.join()
+      self.publisher = None
+
+
+  def _on_training_end(self) -> None:
+    self.wait_for_publish()
+
+
+  def broadcast_parameters(self, filename, params):
+    # sends rank 0's parameters to all ranks as a single flat float32 buffer
+    if MPI.COMM_WORLD.Get_rank() == 0:
+      flat = np.concatenate([value.ravel() for value in params.values()]).astype(np.float32)
+    else:
+      flat = np.empty(sum(value.size for value in params.values()), dtype = np.float32)
+    with timers.time('mpi'):
+      MPI.COMM_WORLD.Bcast(flat, root = 0)
+
+    shared = OrderedDict()
+    offset = 0
+    for name, value in params.items():
+      shared[name] = flat[offset:offset + value.size].reshape(value.shape)
+      offset += value.size
+
+    registry.add_parameters(self.model.env, filename, shared)
+
+
+class LiveWeightsCallback(BaseCallback):
+  """
+  Registers the learner as the 'self' opponent, so that it can play against its current policy
+  without waiting for a promotion and reloading it from disk.
+  The TF backend uses the learner's own policy graph directly. The NumPy backend uses a copy
+  of the policy weights, refreshed every sync_freq steps.
+  """
+  def __init__(self, env, numpy_model = False, sync_freq = 1000, verbose = 0):
+    super(LiveWeightsCallback, self).__init__(verbose)
+    self.env = env
+    self.numpy_model = numpy_model
+    self.sync_freq = sync_freq
+
+  def sync(self):
+    if self.numpy_model:
+      live_model = NumpyModel.from_ppo(self.model, self.env)
+    else:
+      live_model = self.model
+    registry.set_live(self.env.name, self.numpy_model, live_model)
+
+  def _on_training_start(self) -> None:
+    self.sync()
+
+  def _on_step(self) -> bool:
+    if self.numpy_model and self.n_calls % self.sync_freq == 0:
+      self.sync()
+    return True
@@ -0,0 +1,110 @@
+import os
+import random
+import multiprocessing
+import numpy as np
+
+from stable_baselines.common.evaluation import evaluate_policy
+
+from utils.numpy_policy import NumpyModel
+
+
+class CompletedResult():
+    # the AsyncResult interface for an evaluation that has already been run in-process
+    def __init__(self, value):
+        self.value = value
+
+    def ready(self):
+        return True
+
+    def get(self):
+        return self.value
+
+
+class Evaluation():
+    """
+    An evaluation of a snapshot of the model's parameters, taken at num_timesteps.
+    results maps each eval env ('selfplay' / 'rules') to a list of (episode_rewards, episode_lengths) results,
+    which may still be running in an EvaluationPool.
+    """
+    def __init__(self, params, num_timesteps, results, test = None):
+        self.params = params
+        self.num_timesteps = num_timesteps
+        self.results = results
+        self.test = test
+        self.decision = None
+
+    def ready(self):
+        return all(result.ready() for parts in self.results.values() for result in parts)
+
+    def get(self, key):
+        episode_rewards, episode_lengths = [], []
+        for result in self.results[key]:
+            rewards, lengths = result.get()
+            episode_rewards.extend(rewards)
+            episode_lengths.extend(lengths)
+        return episode_rewards, episode_lengths
+
+
+class SequentialTest():
+    """
+    Anytime-valid test of whether the mean episode reward is above threshold, from episodes pooled across ranks.
+    At the k-th look, a Hoeffding bound at level alpha_k = alpha * 6 / (pi^2 k^2) is placed around the running mean,
+    so the chance of a wrong decision over all looks is at most alpha.
+    low and high must bound every episode reward, or the bound doesn't hold.
+    decide returns True / False once the bound clears the threshold, and None while it is still unsettled.
+    """
+    def __init__(self, threshold, alpha, low, high):
+        self.threshold = threshold
+        self.alpha = alpha
+        self.low = low
+        self.high = high
+        self.looks = 0
+
+    def decide(self, total, n):
+        self.looks += 1
+        if n == 0:
+            return None
+        alpha_k = self.alpha * 6 / (np.pi ** 2 * self.looks ** 2)
+        radius = (self.high - self.low) * np.sqrt(np.log(2 / alpha_k) / (2 * n))
+        mean = total / n
+        if mean - radius > self.threshold:
+            return True
+        if mean + radius < self.threshold:
+            return False
+        return None
+
+
+_eval_envs = {}
+
+def init_worker(env_fns, seed):
+    worker_seed = (seed + os.getpid()) % 2 ** 32
+    random.seed(worker_seed)
+    np.random.seed(worker_seed)
+    for key, env_fn in env_fns.items():
+        _eval_envs[key] = env_fn()
+
+
+def evaluate_parameters(key, params, n_eval_episodes, deterministic, render):
+    env = _eval_envs[key]
+    model = NumpyModel(env.name, env.observation_space, params)
+    return evaluate_policy(model, env, n_eval_episodes = n_eval_episodes, deterministic = deterministic, render = render, return_episode_rewards = True)
+
+
+class EvaluationPool():
+    """
+    Forked worker processes that evaluate parameter snapshots with the NumPy policy, off the training critical path.
+    Each worker builds its own eval envs from env_fns (keyed 'selfplay' / 'rules') and should use NumPy opponents,
+    so that no worker builds a TF graph. The episodes of an evaluation are split across the workers.
+    """
+    def __init__(self, env_fns, n_workers, seed = 0):
+        self.n_workers = n_workers
+        ctx = multiprocessing.get_context('fork')
+        self.pool = ctx.Pool(n_workers, initializer = init_worker, initargs = (env_fns, seed))
+
+    def submit(self, key, params, n_eval_episodes, deterministic, render):
+        chunks = [len(c) for c in np.array_split(np.arange(n_eval_episodes), self.n_workers) if len(c) > 0]
+        return [self.pool.apply_async(evaluate_parameters, (key, params, n, deterministic, render)) for n in chunks]
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
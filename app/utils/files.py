@@ -3,57 +3,32 @@
 import os
 import sys
 import random
-import csv
 import time
+import json
+import hashlib
 import numpy as np
 
 from mpi4py import MPI
 
-from shutil import rmtree
+from shutil import rmtree, copyfile
 from stable_baselines.ppo1 import PPO1
 from stable_baselines.common.policies import MlpPolicy
 
 from utils.register import get_network_arch
+from utils.numpy_policy import NumpyModel
 
 import config
 
 from stable_baselines import logger
 
 
-def write_results(players, game, games, episode_length):
-    
-    out = {'game': game
-    , 'games': games
-    , 'episode_length': episode_length
-    , 'p1': players[0].name
-    , 'p2': players[1].name
-    , 'p1_points': players[0].points
-    , 'p2_points': np.sum([x.points for x in players[1:]])
-    }
-
-    if not os.path.exists(config.RESULTSPATH):
-        with open(config.RESULTSPATH,'a') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=out.keys())
-            writer.writeheader()
-
-    with open(config.RESULTSPATH,'a') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=out.keys())
-        writer.writerow(out)
-
-
 def load_model(env, name):
 
     filename = os.path.join(config.MODELDIR, env.name, name)
     if os.path.exists(filename):
+        # models are only ever published with an atomic rename, so an existing file is complete
         logger.info(f'Loading {name}')
-        cont = True
-        while cont:
-            try:
-                ppo_model = PPO1.load(filename, env=env)
-                cont = False
-            except Exception as e:
-                time.sleep(5)
-                print(e)
+        ppo_model = PPO1.load(filename, env=env)
     
     elif name == 'base.zip':
         cont = True
@@ -64,7 +39,7 @@ def load_model(env, name):
                 if rank == 0:
                     ppo_model = PPO1(get_network_arch(env.name), env=env)
                     logger.info(f'Saving base.zip PPO model...')
-                    ppo_model.save(os.path.join(config.MODELDIR, env.name, 'base.zip'))
+                    save_model(ppo_model, os.path.join(config.MODELDIR, env.name, 'base.zip'))
                 else:
 
                     ppo_model = PPO1.load(os.path.join(config.MODELDIR, env.name, 'base.zip'), env=env)
@@ -82,26 +57,182 @@ def load_model(env, name):
     return ppo_model
 
 
-def load_all_models(env):
-    modellist = [f for f in os.listdir(os.path.join(config.MODELDIR, env.name)) if f.startswith("_model")]
+def model_from_parameters(env, params):
+    # builds an opponent from parameters already in memory, e.g. broadcast from another rank
+    ppo_model = PPO1(get_network_arch(env.name), env=env)
+    ppo_model.load_parameters(params)
+    return ppo_model
+
+
+def load_numpy_model(env, name):
+    # the NumPy opponent reads the weights straight from the zip, so no TF session is created
+    filename = os.path.join(config.MODELDIR, env.name, name)
+    if not os.path.exists(filename):
+        load_model(env, name) # creates base.zip if it is missing, otherwise raises
+
+    logger.info(f'Loading {name} as NumPy model')
+    return NumpyModel.load(filename, env)
+
+
+def temporary_path(filename):
+    # hidden sibling in the same directory, so os.replace is atomic and listings ignore it
+    folder, name = os.path.split(filename)
+    return os.path.join(folder, f'.tmp_{os.getpid()}_{name}')
+
+
+def sync_and_replace(tmp, filename):
+    with open(tmp, 'rb+') as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, filename)
+
+
+def save_model(model, filename, params = None):
+    tmp = temporary_path(filename)
+    if params is None:
+        model.save(tmp)
+    else:
+        model.save(tmp, params = params)
+    sync_and_replace(tmp, filename)
+
+
+def copy_model(source_file, target_file):
+    tmp = temporary_path(target_file)
+    copyfile(source_file, tmp)
+    sync_and_replace(tmp, target_file)
+
+
+def file_checksum(filename):
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def manifest_path(env_name):
+    return os.path.join(config.MODELDIR, env_name, config.MANIFEST)
+
+
+_manifest_cache = {}
+
+def read_manifest(env_name):
+    """
+    Returns the list of published generations for env_name, or None if the zoo has no manifest yet.
+    The file is only re-parsed when its size or modification time changes.
+    """
+    path = manifest_path(env_name)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = _manifest_cache.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    with open(path, 'r') as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    _manifest_cache[path] = (key, entries)
+    return entries
+
+
+def append_manifest(env_name, entry):
+    # the manifest is append-only, but is rewritten to a temporary file and renamed so readers never see a partial line
+    path = manifest_path(env_name)
+    existing = ''
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            existing = f.read()
+
+    tmp = temporary_path(path)
+    with open(tmp, 'w') as f:
+        f.write(existing + json.dumps(entry) + '\n')
+    sync_and_replace(tmp, path)
+
+
+def manifest_entry(env_name, filename):
+    generation, timesteps, best_rules_based, best_reward = get_model_stats(filename)
+    return {'generation': generation
+    , 'filename': filename
+    , 'rules_based_reward': best_rules_based
+    , 'reward': best_reward
+    , 'timesteps': timesteps
+    , 'sha256': file_checksum(os.path.join(config.MODELDIR, env_name, filename))
+    }
+
+
+def model_checksum(env_name, name):
+    for entry in read_manifest(env_name) or []:
+        if entry['filename'] == name:
+            return entry['sha256']
+    return file_checksum(os.path.join(config.MODELDIR, env_name, name))
+
+
+def init_manifest(env_name):
+    # indexes the generations of a zoo that was created before the manifest existed
+    if os.path.exists(manifest_path(env_name)):
+        return
+    for filename in list_model_files(env_name):
+        append_manifest(env_name, manifest_entry(env_name, filename))
+
+
+def link_model(source_file, target_file):
+    # best_model.zip is a hard link to the newest generation, falling back to a copy where links aren't supported
+    tmp = temporary_path(target_file)
+    try:
+        os.link(source_file, tmp)
+        os.replace(tmp, target_file)
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        copy_model(source_file, target_file)
+
+
+def model_filename(generation, rules_based_reward, reward, timesteps):
+    generation_str = str(generation).zfill(5)
+    return f"_model_{generation_str}_{rules_based_reward}_{reward}_{timesteps}_.zip"
+
+
+def publish_model(model, env_name, filename, params):
+    # the only serialization of a new generation: one zip written from the snapshot, then linked and indexed
+    model_dir = os.path.join(config.MODELDIR, env_name)
+    save_model(model, os.path.join(model_dir, filename), params = params)
+    link_model(os.path.join(model_dir, filename), os.path.join(model_dir, 'best_model.zip'))
+    append_manifest(env_name, manifest_entry(env_name, filename))
+
+
+def list_model_files(env_name):
+    modellist = [f for f in os.listdir(os.path.join(config.MODELDIR, env_name)) if f.startswith("_model")]
     modellist.sort()
-    models = [load_model(env, 'base.zip')]
-    for model_name in modellist:
-        models.append(load_model(env, name = model_name))
-    return models
+    return modellist
+
+
+def get_model_names(env_name):
+    entries = read_manifest(env_name)
+    if entries is None:
+        return list_model_files(env_name)
+    return [entry['filename'] for entry in entries]
 
 
 def get_best_model_name(env_name):
-    modellist = [f for f in os.listdir(os.path.join(config.MODELDIR, env_name)) if f.startswith("_model")]
+    modellist = get_model_names(env_name)
     
     if len(modellist)==0:
         filename = None
     else:
-        modellist.sort()
         filename = modellist[-1]
         
     return filename
 
+def get_best_model_stats(env_name):
+    entries = read_manifest(env_name)
+    if not entries:
+        return get_model_stats(get_best_model_name(env_name))
+    entry = entries[-1]
+    return entry['generation'], entry['timesteps'], entry['rules_based_reward'], entry['reward']
+
+
 def get_model_stats(filename):
     if filename is None:
         generation = 0
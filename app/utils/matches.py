@@ -0,0 +1,97 @@
+import os
+import random
+import multiprocessing
+import numpy as np
+
+from utils.agents import Agent
+from utils.numpy_policy import NumpyModel
+
+import config
+
+
+def load_players(env, names):
+    # every model as a NumPy model, read once - 'rules' is the rules-based agent
+    models = {}
+    for name in names:
+        if name == 'rules':
+            models[name] = None
+        else:
+            models[name] = NumpyModel.load(os.path.join(config.MODELDIR, env.name, name), env)
+    return models
+
+
+def make_agent(name, model):
+    if name == 'rules':
+        return Agent('rules')
+    return Agent(name, model)
+
+
+def play_games(env, p1, p2, models, n_games, best = False):
+    """
+    Plays n_games with p1 in the first seat and p2 in every other seat, without rendering.
+    Returns the points and results from p1's point of view.
+    """
+    players = [make_agent(p1, models[p1])] + [make_agent(p2, models[p2]) for _ in range(env.n_players - 1)]
+    result = {'p1': p1, 'p2': p2, 'games': n_games, 'p1_points': 0.0, 'p2_points': 0.0, 'p1_wins': 0, 'p2_wins': 0, 'draws': 0, 'episode_length': 0}
+
+    for game in range(n_games):
+        env.reset()
+        done = False
+        points = np.zeros(env.n_players)
+
+        while not done:
+            current_player = players[env.current_player_num]
+            choose_best_action = best and current_player.name != 'rules'
+            action = current_player.choose_action(env, choose_best_action = choose_best_action, mask_invalid_actions = True)
+            _, reward, done, _ = env.step(action)
+            points += reward
+
+        result['p1_points'] += float(points[0])
+        result['p2_points'] += float(np.sum(points[1:]))
+        result['episode_length'] += env.turns_taken
+        if points[0] > np.max(points[1:]):
+            result['p1_wins'] += 1
+        elif points[0] < np.max(points[1:]):
+            result['p2_wins'] += 1
+        else:
+            result['draws'] += 1
+
+    return result
+
+
+_env = None
+_models = None
+
+def init_worker(env_fn, models):
+    global _env, _models
+    _env = env_fn()
+    _models = models
+
+
+def play_match(p1, p2, n_games, best, seed):
+    # seeded per match, so results don't depend on which worker picks the match up
+    random.seed(seed)
+    np.random.seed(seed)
+    return play_games(_env, p1, p2, _models, n_games, best)
+
+
+class MatchPool():
+    """
+    Worker processes that play matches between models loaded once, in the parent, and shared with the forked workers.
+    """
+    def __init__(self, env_fn, models, n_workers):
+        ctx = multiprocessing.get_context('fork')
+        self.pool = ctx.Pool(n_workers, initializer = init_worker, initargs = (env_fn, models))
+
+    def play(self, matches, best = False, seed = 0):
+        # matches is a list of (p1, p2, n_games) - results are yielded as they finish
+        tasks = [(p1, p2, n_games, best, seed + i) for i, (p1, p2, n_games) in enumerate(matches)]
+        return self.pool.imap_unordered(play_match_task, tasks)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+
+def play_match_task(task):
+    return play_match(*task)
@@ -0,0 +1,106 @@
+import os
+import sys
+import types
+import resource
+import numpy as np
+from mpi4py import MPI
+
+from stable_baselines import logger
+
+from utils.numpy_policy import NumpyModel
+
+
+def process_rss():
+    # resident set size of this process in bytes - the peak instead where /proc isn't available
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def peak_rss():
+    # the largest resident set size, in bytes, of this process or any of its finished children (workers, actors, evaluators)
+    usage = [resource.getrusage(who).ru_maxrss for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+    return max(usage) * 1024
+
+
+def is_model(obj):
+    # opponent models belong to the registry, and are counted there
+    return isinstance(obj, NumpyModel) or hasattr(obj, 'graph') and hasattr(obj, 'sess')
+
+
+def object_memory(obj, seen = None):
+    """
+    Approximate bytes held by obj and everything it references, excluding models, modules, classes and functions.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen or is_model(obj) or isinstance(obj, (types.ModuleType, type, types.FunctionType, types.MethodType)):
+        return 0
+    seen.add(id(obj))
+
+    if isinstance(obj, np.ndarray):
+        # a view's data is counted with the array it views
+        return sys.getsizeof(obj) + object_memory(obj.base, seen)
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(object_memory(k, seen) + object_memory(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(object_memory(x, seen) for x in obj)
+    if hasattr(obj, '__dict__'):
+        size += object_memory(vars(obj), seen)
+    return size
+
+
+def rollout_memory(env, horizon):
+    """
+    Bytes of a PPO1 rollout of horizon steps: the segment's observations, actions and per-step scalars,
+    plus the shuffled copy PPO1's Dataset makes of them for the update.
+    """
+    # the envs build their observations as float64, whatever the dtype of the observation space
+    observation = int(np.prod(env.observation_space.shape)) * np.dtype(np.float64).itemsize
+    action = np.dtype(env.action_space.dtype).itemsize * max(1, int(np.prod(env.action_space.shape)))
+    segment = horizon * (observation + action + 8 * 8) # rewards, true rewards, vpreds, dones, episode starts, adv, tdlamret, nextvpred
+    dataset = horizon * (observation + action + 2 * 8)
+    return segment + dataset
+
+
+class MemoryMonitor():
+    """
+    Accounts for the memory of a rank at each evaluation: the opponent models in the registry, the rollout
+    buffer and the eval envs, against the process's resident set size. Anything not accounted for is 'other'.
+    """
+    def __init__(self, registry, env, eval_envs, horizon):
+        self.registry = registry
+        self.env = env
+        self.eval_envs = eval_envs
+        self.horizon = horizon
+
+    def measure(self):
+        models = self.registry.model_sizes()
+        report = {
+            'rss': process_rss(),
+            'opponents': sum(size for _, size in models),
+            'rollout': rollout_memory(self.env, self.horizon),
+            'eval_envs': sum(object_memory(env) for env in self.eval_envs),
+        }
+        report['other'] = max(0, report['rss'] - report['opponents'] - report['rollout'] - report['eval_envs'])
+        return report, models
+
+    def log(self):
+        """
+        Enforces the registry's limits, then logs the largest value of each part across ranks. A collective, so every rank must call it.
+        """
+        self.registry.enforce_limits()
+        report, models = self.measure()
+        reports = MPI.COMM_WORLD.allgather(report)
+
+        if MPI.COMM_WORLD.Get_rank() == 0:
+            largest = {key: max(r[key] for r in reports) / 1e6 for key in report}
+            for key, mb in largest.items():
+                logger.record_tabular(f'memory/{key}_mb', mb)
+            logger.info('Memory (MB, largest rank): ' + ', '.join(f'{key} {mb:.1f}' for key, mb in largest.items()))
+            if len(models) > 0:
+                logger.info(f'Opponent models on rank 0 ({len(models)}): ' + ', '.join(f'{name} {size / 1e6:.1f}' for name, size in models))
@@ -0,0 +1,213 @@
+import io
+import json
+import zipfile
+from collections import OrderedDict
+
+import numpy as np
+
+from utils.register import get_numpy_arch
+
+
+BN_EPSILON = 1e-3 # keras BatchNormalization default
+
+
+def read_parameters(filename):
+    # reads the parameter arrays straight out of a stable-baselines zip, without building a TF graph
+    with zipfile.ZipFile(filename, 'r') as archive:
+        parameter_list = json.loads(archive.read('parameter_list').decode())
+        params = np.load(io.BytesIO(archive.read('parameters')))
+        return OrderedDict((name, params[name]) for name in parameter_list)
+
+
+class Layers():
+    """
+    The policy weights grouped by keras layer, in the order the layers were created.
+    stable-baselines only saves the acting policy's trainable variables (all under 'model/'), so every parameter is used.
+    Architectures consume them in the same order that models/<env>/models.py calls them.
+    """
+    def __init__(self, params):
+        self.layers = OrderedDict()
+        for name, value in params.items():
+            layer, variable = name.rsplit('/', 1)
+            self.layers.setdefault(layer, {})[variable.split(':')[0]] = np.asarray(value, dtype = np.float32)
+        self.layers = list(self.layers.values())
+        self.cursor = 0
+
+    def rewind(self):
+        self.cursor = 0
+
+    def next(self, kind):
+        if self.cursor >= len(self.layers):
+            raise Exception(f'Architecture expects more layers than the {len(self.layers)} found in the model parameters')
+
+        layer = self.layers[self.cursor]
+        if kind == 'batch_normalization':
+            found = 'gamma' in layer
+        elif kind == 'conv2d':
+            found = 'kernel' in layer and layer['kernel'].ndim == 4
+        else:
+            found = 'kernel' in layer and layer['kernel'].ndim == 2
+
+        if not found:
+            raise Exception(f'Expected a {kind} layer at position {self.cursor} but found variables {list(layer.keys())}')
+
+        self.cursor += 1
+        return layer
+
+    @property
+    def exhausted(self):
+        return self.cursor == len(self.layers)
+
+
+def relu(y):
+    return np.maximum(y, 0)
+
+
+def tanh(y):
+    return np.tanh(y)
+
+
+ACTIVATIONS = {'relu': relu, 'tanh': tanh}
+
+
+def activate(y, name):
+    if name:
+        return ACTIVATIONS[name](y)
+    return y
+
+
+def conv2d(layers, y, strides = (1,1)):
+    # matches Conv2D(padding='same') in NHWC layout
+    layer = layers.next('conv2d')
+    kernel, bias = layer['kernel'], layer['bias']
+    kh, kw, _, _ = kernel.shape
+    sh, sw = strides
+
+    if kh == 1 and kw == 1:
+        return np.matmul(y[:, ::sh, ::sw], kernel[0,0]) + bias
+
+    n, h, w, c = y.shape
+    out_h = -(-h // sh)
+    out_w = -(-w // sw)
+    pad_h = max((out_h - 1) * sh + kh - h, 0)
+    pad_w = max((out_w - 1) * sw + kw - w, 0)
+    y = np.pad(y, ((0,0), (pad_h // 2, pad_h - pad_h // 2), (pad_w // 2, pad_w - pad_w // 2), (0,0)))
+
+    s = y.strides
+    windows = np.lib.stride_tricks.as_strided(y
+        , shape = (n, out_h, out_w, kh, kw, c)
+        , strides = (s[0], s[1] * sh, s[2] * sw, s[1], s[2], s[3])
+        , writeable = False)
+
+    return np.tensordot(windows, kernel, axes = ([3,4,5], [0,1,2])) + bias
+
+
+def batch_normalization(layers, y):
+    # keras BatchNormalization runs in inference mode in the stable-baselines graph,
+    # so it applies the moving statistics, which stay at their initial values unless saved
+    layer = layers.next('batch_normalization')
+    mean = layer.get('moving_mean', 0)
+    variance = layer.get('moving_variance', 1)
+    return layer['gamma'] * (y - mean) / np.sqrt(variance + BN_EPSILON) + layer['beta']
+
+
+def dense(layers, y, batch_norm = False, activation = 'relu'):
+    layer = layers.next('dense')
+    y = np.matmul(y, layer['kernel']) + layer['bias']
+    if batch_norm:
+        y = batch_normalization(layers, y)
+    return activate(y, activation)
+
+
+def skip(layers, kind):
+    layers.next(kind)
+
+
+def flatten(y):
+    return y.reshape(y.shape[0], -1)
+
+
+def softmax(logits):
+    e = np.exp(logits - np.max(logits, axis = -1, keepdims = True))
+    return e / np.sum(e, axis = -1, keepdims = True)
+
+
+class NumpyPolicy():
+    """
+    Forward pass of a CustomPolicy from models/<env>/models.py in plain NumPy.
+    Mirrors the proba_step / value / step interface of the stable-baselines policy.
+    """
+    def __init__(self, env_name, observation_space, params):
+        self.forward = get_numpy_arch(env_name)
+        self.observation_space = observation_space
+        self.layers = Layers(params)
+
+        low = np.asarray(observation_space.low, dtype = np.float32)
+        high = np.asarray(observation_space.high, dtype = np.float32)
+        # stable-baselines scales bounded Box observations to [0, 1] when scale=True
+        if not np.any(np.isinf(low)) and not np.any(np.isinf(high)) and np.any((high - low) != 0):
+            self.low, self.range = low, high - low
+        else:
+            self.low, self.range = None, None
+
+        self.run(np.zeros((1,) + observation_space.shape, dtype = np.float32))
+        if not self.layers.exhausted:
+            raise Exception(f'The {env_name} NumPy architecture only used {self.layers.cursor} of the {len(self.layers.layers)} layers in the model parameters')
+
+    def run(self, obs):
+        obs = np.asarray(obs, dtype = np.float32)
+        if self.low is not None:
+            obs = (obs - self.low) / self.range
+        self.layers.rewind()
+        return self.forward(self.layers, obs)
+
+    def proba_step(self, obs, state=None, mask=None):
+        logits, _ = self.run(obs)
+        return softmax(logits)
+
+    def value(self, obs, state=None, mask=None):
+        _, value = self.run(obs)
+        return value[:, 0]
+
+    def step(self, obs, state=None, mask=None, deterministic=False):
+        logits, value = self.run(obs)
+        probs = softmax(logits)
+        if deterministic:
+            action = np.argmax(probs, axis = 1)
+        else:
+            action = (np.random.rand(len(probs), 1) < np.cumsum(probs, axis = 1)).argmax(axis = 1)
+        neglogp = -np.log(probs[np.arange(len(action)), action] + 1e-8)
+        return action, value[:, 0], None, neglogp
+
+
+class NumpyModel():
+    """
+    A frozen opponent that only needs the NumPy policy: no TF graph, session or optimizer state.
+    Exposes the parts of the PPO1 interface that Agent uses.
+    """
+    def __init__(self, env_name, observation_space, params):
+        self.policy_pi = NumpyPolicy(env_name, observation_space, params)
+        self.observation_space = observation_space
+
+    @classmethod
+    def load(cls, filename, env):
+        return cls(env.name, env.observation_space, read_parameters(filename))
+
+    @classmethod
+    def from_ppo(cls, ppo_model, env):
+        return cls(env.name, env.observation_space, ppo_model.get_parameters())
+
+    def vectorized(self, observation):
+        return np.ndim(observation) > len(self.observation_space.shape)
+
+    def action_probability(self, observation, state=None, mask=None):
+        if self.vectorized(observation):
+            return self.policy_pi.proba_step(observation)
+        return self.policy_pi.proba_step(np.asarray(observation)[None])[0]
+
+    def predict(self, observation, state=None, mask=None, deterministic=False):
+        if self.vectorized(observation):
+            action, _, _, _ = self.policy_pi.step(observation, deterministic = deterministic)
+            return action, None
+        action, _, _, _ = self.policy_pi.step(np.asarray(observation)[None], deterministic = deterministic)
+        return action[0], None
@@ -0,0 +1,70 @@
+import numpy as np
+
+
+def hard(win_rate, exponent):
+    # focus on the generations the agent still loses to
+    return (1 - win_rate) ** exponent
+
+
+def variance(win_rate, exponent):
+    # focus on the generations the agent is evenly matched with
+    return win_rate * (1 - win_rate)
+
+
+def linear(win_rate, exponent):
+    return 1 - win_rate
+
+
+WEIGHTINGS = {'hard': hard, 'variance': variance, 'linear': linear}
+
+
+def game_outcome(reward):
+    # maps the agent's final reward onto a score in [0, 1]: win 1, draw / middle place 0.5, loss 0
+    return float(np.clip((reward + 1) / 2, 0, 1))
+
+
+class WinRates():
+    """
+    Running win rate of the agent against each opponent generation, from completed episodes.
+    The estimate is the plain mean for the first `window` games and an exponential moving average after that,
+    so it keeps up with the agent as it improves.
+    """
+    def __init__(self, window = 100, prior = 0.5):
+        self.window = window
+        self.prior = prior
+        self.rates = {}
+        self.games = {}
+
+    def update(self, name, outcome):
+        games = self.games.get(name, 0) + 1
+        rate = self.rates.get(name, self.prior)
+        self.rates[name] = rate + (outcome - rate) / min(games, self.window)
+        self.games[name] = games
+
+    def get(self, name):
+        return self.rates.get(name, self.prior)
+
+
+class PFSP():
+    """
+    Prioritized fictitious self-play: samples opponent generations in proportion to
+    weighting(win rate of the agent against that generation).
+    """
+    def __init__(self, weighting = 'hard', exponent = 2.0, window = 100):
+        if weighting not in WEIGHTINGS:
+            raise Exception(f'Unknown PFSP weighting {weighting}: choose from {list(WEIGHTINGS.keys())}')
+        self.weighting = WEIGHTINGS[weighting]
+        self.exponent = exponent
+        self.win_rates = WinRates(window)
+
+    def probabilities(self, names):
+        weights = np.array([self.weighting(self.win_rates.get(name), self.exponent) for name in names])
+        if np.sum(weights) <= 0: # the agent beats every generation - fall back to uniform
+            weights = np.ones(len(names))
+        return weights / np.sum(weights)
+
+    def sample(self, names):
+        return names[np.random.choice(len(names), p = self.probabilities(names))]
+
+    def update(self, name, reward):
+        self.win_rates.update(name, game_outcome(reward))
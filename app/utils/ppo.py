@@ -0,0 +1,81 @@
+from stable_baselines.ppo1 import PPO1
+from stable_baselines.ppo1 import pposgd_simple
+
+from utils.timing import timers, timed_segments
+
+
+class SelfPlayPPO1(PPO1):
+    """
+    PPO1 with a pluggable rollout.
+    When segment_generator is set, learn() collects its segments with
+    segment_generator(model, env, horizon, callback) instead of stable_baselines' traj_segment_generator.
+    When the phase timers are enabled, the rollout and update times of each iteration are logged with PPO1's stats
+    and written to PPO1's tensorboard log.
+    The optimisation loop itself is PPO1's, unchanged.
+    """
+    def __init__(self, *args, segment_generator = None, **kwargs):
+        self.segment_generator = segment_generator
+        super(SelfPlayPPO1, self).__init__(*args, **kwargs)
+
+    def learn(self, *args, **kwargs):
+        if self.segment_generator is None and not timers.enabled:
+            return super(SelfPlayPPO1, self).learn(*args, **kwargs)
+
+        original = pposgd_simple.traj_segment_generator
+        original_writer = pposgd_simple.TensorboardWriter
+
+        class TimedTensorboardWriter(original_writer):
+            # hands PPO1's writer to the phase timers
+            def __enter__(self):
+                timers.writer = super(TimedTensorboardWriter, self).__enter__()
+                return timers.writer
+
+        def traj_segment_generator(policy, env, horizon, callback = None, **kwargs):
+            if self.segment_generator is None:
+                segments = original(policy, env, horizon, callback = callback, **kwargs)
+            else:
+                segments = self.segment_generator(self, env, horizon, callback)
+            if timers.enabled:
+                segments = timed_segments(segments, timers, self)
+            return segments
+
+        pposgd_simple.traj_segment_generator = traj_segment_generator
+        pposgd_simple.TensorboardWriter = TimedTensorboardWriter
+        try:
+            return super(SelfPlayPPO1, self).learn(*args, **kwargs)
+        finally:
+            pposgd_simple.traj_segment_generator = original
+            pposgd_simple.TensorboardWriter = original_writer
+            timers.writer = None
+
+    def save(self, save_path, cloudpickle = False, params = None):
+        """
+        As PPO1.save, but params can be a snapshot taken earlier, e.g. at evaluation time, instead of the current weights.
+        Only reads attributes of the model, so a snapshot can be saved from a background thread while training carries on.
+        """
+        data = {
+            "gamma": self.gamma,
+            "timesteps_per_actorbatch": self.timesteps_per_actorbatch,
+            "clip_param": self.clip_param,
+            "entcoeff": self.entcoeff,
+            "optim_epochs": self.optim_epochs,
+            "optim_stepsize": self.optim_stepsize,
+            "optim_batchsize": self.optim_batchsize,
+            "lam": self.lam,
+            "adam_epsilon": self.adam_epsilon,
+            "schedule": self.schedule,
+            "verbose": self.verbose,
+            "policy": self.policy,
+            "observation_space": self.observation_space,
+            "action_space": self.action_space,
+            "n_envs": self.n_envs,
+            "n_cpu_tf_sess": self.n_cpu_tf_sess,
+            "seed": self.seed,
+            "_vectorize_action": self._vectorize_action,
+            "policy_kwargs": self.policy_kwargs
+        }
+
+        if params is None:
+            params = self.get_parameters()
+
+        self._save_to_file(save_path, data = data, params = params, cloudpickle = cloudpickle)
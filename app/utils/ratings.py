@@ -0,0 +1,100 @@
+import os
+import json
+import numpy as np
+
+from utils.files import temporary_path, sync_and_replace
+
+import config
+
+Q = np.log(10) / 400
+INITIAL_RATING = 1500.0
+INITIAL_RD = 350.0
+MIN_RD = 30.0
+
+
+def g(rd):
+    return 1 / np.sqrt(1 + 3 * Q ** 2 * rd ** 2 / np.pi ** 2)
+
+
+def expected_score(rating, rating_j, rd_j):
+    return 1 / (1 + 10 ** (-g(rd_j) * (rating - rating_j) / 400))
+
+
+def ratings_path(env_name):
+    return os.path.join(config.MODELDIR, env_name, config.RATINGS)
+
+
+class RatingStore():
+    """
+    Persistent Glicko ratings for the players of an env, keyed by model checksum (or 'rules'),
+    so a generation keeps its rating however its file is renamed and only new models need new games.
+    Each entry holds the rating, its deviation (rd) and the number of games it is based on.
+    """
+    def __init__(self, env_name, ratings = None):
+        self.env_name = env_name
+        self.ratings = ratings or {}
+
+    @classmethod
+    def load(cls, env_name):
+        path = ratings_path(env_name)
+        if not os.path.exists(path):
+            return cls(env_name)
+        with open(path, 'r') as f:
+            return cls(env_name, json.load(f))
+
+    def save(self):
+        path = ratings_path(self.env_name)
+        tmp = temporary_path(path)
+        with open(tmp, 'w') as f:
+            json.dump(self.ratings, f, indent = 1)
+        sync_and_replace(tmp, path)
+
+    def add(self, key, name):
+        if key not in self.ratings:
+            self.ratings[key] = {'name': name, 'rating': INITIAL_RATING, 'rd': INITIAL_RD, 'games': 0}
+        self.ratings[key]['name'] = name
+
+    def update(self, key, opponent, wins, draws, losses):
+        """
+        Glicko update of both players from a batch of games between them, treated as one rating period.
+        """
+        a, b = self.ratings[key], self.ratings[opponent]
+        scores = [1.0] * wins + [0.5] * draws + [0.0] * losses
+        new_a = self.rate(a, b, scores)
+        new_b = self.rate(b, a, [1 - s for s in scores])
+        a.update(new_a)
+        b.update(new_b)
+
+    def rate(self, player, opponent, scores):
+        n = len(scores)
+        gj = g(opponent['rd'])
+        e = expected_score(player['rating'], opponent['rating'], opponent['rd'])
+        d2 = 1 / (Q ** 2 * n * gj ** 2 * e * (1 - e))
+        denominator = 1 / player['rd'] ** 2 + 1 / d2
+        rating = player['rating'] + Q / denominator * gj * sum(s - e for s in scores)
+        rd = max(np.sqrt(1 / denominator), MIN_RD)
+        return {'rating': float(rating), 'rd': float(rd), 'games': player['games'] + n}
+
+    def uncertainty(self, key, opponent):
+        # how much a game between the two would tell us: their combined deviation, weighted to close matches
+        a, b = self.ratings[key], self.ratings[opponent]
+        e = expected_score(a['rating'], b['rating'], b['rd'])
+        return np.sqrt(a['rd'] ** 2 + b['rd'] ** 2) * 4 * e * (1 - e)
+
+    def schedule(self, keys, n_matches, target_rd):
+        """
+        The n_matches pairings with the most uncertainty, among pairings that involve at least one player
+        whose rd is still above target_rd. Settled players are never matched against each other again.
+        """
+        unsettled = [key for key in keys if self.ratings[key]['rd'] > target_rd]
+        pairings = set()
+        for key in unsettled:
+            for opponent in keys:
+                if opponent != key:
+                    pairings.add(tuple(sorted((key, opponent))))
+
+        ranked = sorted(pairings, key = lambda pairing: -self.uncertainty(*pairing))
+        return ranked[:n_matches]
+
+    def table(self):
+        return sorted(self.ratings.items(), key = lambda item: -item[1]['rating'])
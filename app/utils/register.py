@@ -52,3 +52,26 @@ def get_network_arch(env_name):
     else:
         raise Exception(f'No model architectures found for {env_name}')
 
+
+
+def get_numpy_arch(env_name):
+    if env_name in ('tictactoe'):
+        from models.tictactoe.numpy_models import forward
+        return forward
+    elif env_name in ('connect4'):
+        from models.connect4.numpy_models import forward
+        return forward
+    elif env_name in ('sushigo'):
+        from models.sushigo.numpy_models import forward
+        return forward
+    elif env_name in ('butterfly'):
+        from models.butterfly.numpy_models import forward
+        return forward
+    elif env_name in ('geschenkt'):
+        from models.geschenkt.numpy_models import forward
+        return forward
+    elif env_name in ('frouge'):
+        from models.frouge.numpy_models import forward
+        return forward
+    else:
+        raise Exception(f'No NumPy model architectures found for {env_name}')
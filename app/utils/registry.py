@@ -0,0 +1,217 @@
+import gc
+import time
+import threading
+import weakref
+from collections import OrderedDict
+
+from utils.files import load_model, load_numpy_model, model_from_parameters, get_best_model_name
+from utils.numpy_policy import NumpyModel
+from utils.timing import timers
+from utils.memory import process_rss
+
+from stable_baselines import logger
+
+LIVE_MODEL = 'self' # opponent name for the learner's own current policy
+
+
+def model_memory(model):
+    """
+    Estimated bytes held by a loaded model.
+    A NumPy model only holds its policy weights. A PPO1 model holds every variable in its graph
+    (policy, old policy and optimizer slots) plus the graph definition itself.
+    """
+    if isinstance(model, NumpyModel):
+        return sum(value.nbytes for layer in model.policy_pi.layers.layers for value in layer.values())
+
+    variables = model.graph.get_collection('variables')
+    weights = sum(v.shape.num_elements() * v.dtype.base_dtype.size for v in variables)
+    return weights + model.graph.as_graph_def().ByteSize()
+
+
+class ModelRegistry():
+    """
+    Process-wide cache of opponent models, shared by every SelfPlayEnv in the process.
+    Models are loaded the first time they are requested and kept in least-recently-used order.
+    When a memory budget is set, the least recently used models are dropped to stay within it.
+    When an rss limit is set, models adding up to the estimated excess of the process over it are also dropped,
+    rather than letting it be OOM-killed. Models still played by an attached env are never dropped,
+    and a dropped TF model's session is closed so that its memory is actually released.
+    """
+    def __init__(self):
+        self.models = OrderedDict()
+        self.backends = set()
+        self.prefetchers = {}
+        self.live = {}
+        self.envs = weakref.WeakSet()
+        self.budget = None
+        self.rss_limit = None
+        self.lock = threading.RLock()
+
+    def configure(self, budget_mb, rss_limit_mb = None):
+        self.budget = None if budget_mb is None else int(budget_mb * 1024 * 1024)
+        self.rss_limit = None if rss_limit_mb is None else int(rss_limit_mb * 1024 * 1024)
+        self.enforce_limits()
+
+    def enforce_limits(self):
+        with self.lock:
+            self.evict()
+
+    def key(self, env_name, name, numpy_model):
+        return (env_name, name, numpy_model)
+
+    def attach(self, env):
+        # envs whose current opponents must stay loaded
+        with self.lock:
+            self.envs.add(env)
+
+    def in_use(self):
+        # ids of the models the attached envs' agents are playing with
+        models = set()
+        for env in list(self.envs):
+            agents = list(getattr(env, 'agents', [])) + [getattr(env, 'opponent_agent', None)]
+            models.update(id(agent.model) for agent in agents if agent is not None and agent.model is not None)
+        return models
+
+    def get(self, env, name, numpy_model = False):
+        if name == LIVE_MODEL:
+            return self.get_live(env.name, numpy_model)
+
+        key = self.key(env.name, name, numpy_model)
+        with self.lock:
+            self.backends.add((env.name, numpy_model))
+            if key in self.models:
+                self.models.move_to_end(key)
+                return self.models[key][0]
+
+        # timed by hand rather than with timers.time, as the prefetch thread loads models too
+        start = time.perf_counter()
+        if numpy_model:
+            model = load_numpy_model(env, name)
+        else:
+            model = load_model(env, name)
+        timers.add('model_load', time.perf_counter() - start)
+
+        return self.put(env.name, name, numpy_model, model)
+
+    def put(self, env_name, name, numpy_model, model):
+        key = self.key(env_name, name, numpy_model)
+        size = model_memory(model)
+        with self.lock:
+            if key in self.models: # loaded by another caller in the meantime
+                self.models.move_to_end(key)
+                return self.models[key][0]
+            self.models[key] = (model, size)
+            self.evict(keep = key)
+        return model
+
+    def add_parameters(self, env, name, params):
+        # registers a generation from in-memory parameters for every backend in use for this env
+        with self.lock:
+            backends = [numpy_model for env_name, numpy_model in self.backends if env_name == env.name]
+
+        for numpy_model in backends:
+            start = time.perf_counter()
+            if numpy_model:
+                model = NumpyModel(env.name, env.observation_space, params)
+            else:
+                model = model_from_parameters(env, params)
+            timers.add('model_load', time.perf_counter() - start)
+            self.put(env.name, name, numpy_model, model)
+
+    def set_live(self, env_name, numpy_model, model):
+        # the live model is never evicted - it is the learner itself, or a small NumPy copy of it
+        with self.lock:
+            self.live[(env_name, numpy_model)] = model
+
+    def get_live(self, env_name, numpy_model = False):
+        with self.lock:
+            if (env_name, numpy_model) not in self.live:
+                raise Exception(f'No live model registered for {env_name} - add a LiveWeightsCallback to model.learn')
+            return self.live[(env_name, numpy_model)]
+
+    def contains(self, env_name, name, numpy_model = False):
+        with self.lock:
+            return self.key(env_name, name, numpy_model) in self.models
+
+    def start_prefetch(self, env, numpy_model = False, interval = 2):
+        key = (env.name, numpy_model)
+        if key not in self.prefetchers:
+            self.prefetchers[key] = GenerationPrefetcher(self, env, numpy_model, interval)
+            self.prefetchers[key].start()
+
+    def prefetching(self, env_name, numpy_model = False):
+        return (env_name, numpy_model) in self.prefetchers
+
+    def ready(self, env_name, name, numpy_model = False):
+        # without a prefetcher every generation counts as ready and is loaded on first use
+        return not self.prefetching(env_name, numpy_model) or self.contains(env_name, name, numpy_model)
+
+    @property
+    def memory(self):
+        with self.lock:
+            return sum(size for _, size in self.models.values())
+
+    def model_sizes(self):
+        # (name, bytes) of every cached model, least recently used first
+        with self.lock:
+            return [(name + (' (numpy)' if numpy_model else ''), size) for (_, name, numpy_model), (_, size) in self.models.items()]
+
+    def over_budget(self):
+        return self.budget is not None and self.memory > self.budget
+
+    def evict(self, keep = None):
+        if self.budget is None and self.rss_limit is None:
+            return
+        # RSS is read once: freed TF and glibc memory isn't always handed back to the OS, so re-reading it
+        # after each eviction could empty the whole cache. The recorded model sizes stand in for what is freed.
+        excess = max(0, process_rss() - self.rss_limit) if self.rss_limit is not None else 0
+        in_use = self.in_use()
+        evicted = False
+        for key in list(self.models.keys()):
+            over_budget = self.over_budget()
+            if not over_budget and excess <= 0:
+                break
+            model, size = self.models[key]
+            if key == keep or id(model) in in_use:
+                continue
+            del self.models[key]
+            if hasattr(model, 'sess'):
+                model.sess.close()
+            excess -= size
+            evicted = True
+            reason = 'opponent memory budget' if over_budget else 'rss limit'
+            logger.info(f'Evicting {key[1]} from the opponent registry ({size / 1e6:.1f}MB, {reason})')
+        model = None
+        if evicted:
+            gc.collect()
+
+
+class GenerationPrefetcher(threading.Thread):
+    """
+    Watches the zoo for a new best generation and loads it into the registry in the background,
+    so that SelfPlayEnv can switch to it at the next reset without waiting on the load.
+    """
+    def __init__(self, registry, env, numpy_model, interval):
+        super(GenerationPrefetcher, self).__init__(daemon = True)
+        self.registry = registry
+        self.env = env
+        self.numpy_model = numpy_model
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            name = get_best_model_name(self.env.name)
+            if name is None or self.registry.contains(self.env.name, name, self.numpy_model):
+                continue
+            try:
+                logger.debug(f'Prefetching {name}')
+                self.registry.get(self.env, name, self.numpy_model)
+            except Exception as e:
+                logger.error(f'Prefetch of {name} failed: {e}')
+
+    def stop(self):
+        self.stopped.set()
+
+
+registry = ModelRegistry()
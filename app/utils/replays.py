@@ -0,0 +1,145 @@
+import os
+import random
+import socket
+import numpy as np
+
+from contextlib import contextmanager
+
+from utils.results import write_shard
+
+import config
+
+
+class GameRandom():
+    """
+    The Python random state of one game. The envs only draw from the global random module, so swapping this
+    state in around each env call makes the game a pure function of its seed and actions, whatever else
+    uses random in between.
+    """
+    def __init__(self, seed):
+        self.state = random.Random(seed).getstate()
+
+    @contextmanager
+    def active(self):
+        outside = random.getstate()
+        random.setstate(self.state)
+        try:
+            yield
+        finally:
+            self.state = random.getstate()
+            random.setstate(outside)
+
+
+class GameRecorder():
+    """
+    Records a sample of games as a seed, the actions played and, optionally, the policy outputs behind them.
+    Games are buffered and flushed every flush_every games as a new shard in directory, holding flat arrays
+    indexed by per-game offsets, so recording costs a list append per move.
+    """
+    def __init__(self, env_name, n_players, n_actions, directory = config.REPLAYDIR, sample_rate = 1.0, policy_outputs = False, flush_every = 100, seed = None):
+        self.env_name = env_name
+        self.n_players = n_players
+        self.n_actions = n_actions
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.policy_outputs = policy_outputs
+        self.flush_every = flush_every
+        # separate from the global random state, so recording doesn't change the games being played
+        self.rng = random.Random(seed)
+        self.prefix = f'{env_name}_{socket.gethostname()}_{os.getpid()}'
+        self.shards = 0
+        self.game = None
+        self.reset_buffers()
+
+    def reset_buffers(self):
+        self.seeds, self.players, self.rewards, self.lengths = [], [], [], []
+        self.actions, self.outputs = [], []
+
+    def start(self):
+        # returns the GameRandom of a sampled game, or None if this game isn't recorded
+        if self.rng.random() >= self.sample_rate:
+            self.game = None
+            return None
+        seed = self.rng.getrandbits(32)
+        self.game = {'seed': seed, 'actions': [], 'outputs': [], 'rewards': np.zeros(self.n_players), 'random': GameRandom(seed)}
+        return self.game['random']
+
+    @property
+    def recording(self):
+        return self.game is not None
+
+    def record(self, action, reward, policy_output = None):
+        self.game['actions'].append(action)
+        self.game['rewards'] += reward
+        if self.policy_outputs:
+            self.game['outputs'].append(policy_output)
+
+    def finish(self, players):
+        self.seeds.append(self.game['seed'])
+        self.players.append('|'.join(players))
+        self.rewards.append(self.game['rewards'])
+        self.lengths.append(len(self.game['actions']))
+        self.actions.extend(self.game['actions'])
+        if self.policy_outputs:
+            missing = np.full(self.n_actions, np.nan)
+            self.outputs.extend(missing if output is None else output for output in self.game['outputs'])
+        self.game = None
+        if len(self.seeds) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if len(self.seeds) == 0:
+            return
+        os.makedirs(self.directory, exist_ok = True)
+        while True:
+            filename = os.path.join(self.directory, f'{self.prefix}_{self.shards:06d}.npz')
+            self.shards += 1
+            if not os.path.exists(filename):
+                break
+
+        columns = {
+            'env': np.array(self.env_name),
+            'seeds': np.array(self.seeds, dtype = np.uint32),
+            'players': np.array(self.players),
+            'rewards': np.array(self.rewards, dtype = np.float32).reshape(-1, self.n_players),
+            'offsets': np.concatenate([[0], np.cumsum(self.lengths)]).astype(np.int64),
+            'actions': np.array(self.actions, dtype = np.uint16),
+        }
+        if self.policy_outputs:
+            columns['outputs'] = np.array(self.outputs, dtype = np.float16).reshape(-1, self.n_actions)
+        write_shard(filename, columns)
+        self.reset_buffers()
+
+    def close(self):
+        self.flush()
+
+
+class Replay():
+    # one recorded game - outputs is None unless policy outputs were recorded
+    def __init__(self, env_name, seed, players, rewards, actions, outputs = None):
+        self.env_name = env_name
+        self.seed = seed
+        self.players = players
+        self.rewards = rewards
+        self.actions = actions
+        self.outputs = outputs
+
+
+def replay_names(directory = config.REPLAYDIR, env_name = None):
+    if not os.path.exists(directory):
+        return []
+    names = sorted(f for f in os.listdir(directory) if f.endswith('.npz') and not f.startswith('.'))
+    if env_name is not None:
+        names = [f for f in names if f.startswith(f'{env_name}_')]
+    return names
+
+
+def read_replays(filename):
+    with np.load(filename) as shard:
+        columns = {key: shard[key] for key in shard.files}
+    offsets = columns['offsets']
+    outputs = columns.get('outputs')
+    env_name = str(columns['env'])
+    for i, seed in enumerate(columns['seeds']):
+        start, end = offsets[i], offsets[i + 1]
+        yield Replay(env_name, int(seed), str(columns['players'][i]).split('|'), columns['rewards'][i], columns['actions'][start:end].astype(int), None if outputs is None else outputs[start:end].astype(np.float32))
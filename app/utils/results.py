@@ -0,0 +1,165 @@
+import os
+import csv
+import time
+import socket
+import numpy as np
+
+from utils.files import temporary_path, sync_and_replace
+
+import config
+
+COLUMNS = ['env', 'p1', 'p2', 'game', 'games', 'episode_length', 'p1_points', 'p2_points', 'p1_result']
+
+
+def game_result(env_name, players, game, games, episode_length):
+    # one row per game, from the first seat's point of view - p1_result is 1 / 0 / -1 for a win / draw / loss
+    p1_points = players[0].points
+    best_other = np.max([x.points for x in players[1:]])
+    return {'env': env_name
+    , 'p1': players[0].name
+    , 'p2': players[1].name
+    , 'game': game
+    , 'games': games
+    , 'episode_length': episode_length
+    , 'p1_points': float(p1_points)
+    , 'p2_points': float(np.sum([x.points for x in players[1:]]))
+    , 'p1_result': int(np.sign(p1_points - best_other))
+    }
+
+
+class ResultsWriter():
+    """
+    Buffers game results in memory and flushes them every flush_every rows as a new shard in directory:
+    a compressed .npz holding one array per column. Every process writes its own shards, published with
+    an atomic rename, so concurrent writers never share a file and readers never see a partial shard.
+    """
+    def __init__(self, directory = config.RESULTSDIR, flush_every = 1000):
+        self.directory = directory
+        self.flush_every = flush_every
+        self.prefix = f'{socket.gethostname()}_{os.getpid()}'
+        self.shards = 0
+        self.rows = {column: [] for column in COLUMNS}
+        self.n_rows = 0
+
+    def add(self, row):
+        for column in COLUMNS:
+            self.rows[column].append(row[column])
+        self.n_rows += 1
+        if self.n_rows >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if self.n_rows == 0:
+            return
+        os.makedirs(self.directory, exist_ok = True)
+        # the shard counter keeps names unique within the process, and pid reuse can't clobber an older shard
+        while True:
+            filename = os.path.join(self.directory, f'{self.prefix}_{self.shards:06d}.npz')
+            self.shards += 1
+            if not os.path.exists(filename):
+                break
+        write_shard(filename, {column: np.array(values) for column, values in self.rows.items()})
+        self.rows = {column: [] for column in COLUMNS}
+        self.n_rows = 0
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def write_shard(filename, columns):
+    tmp = temporary_path(filename)
+    np.savez_compressed(tmp, **columns)
+    sync_and_replace(tmp, filename)
+
+
+def shard_names(directory = config.RESULTSDIR):
+    if not os.path.exists(directory):
+        return []
+    return sorted(f for f in os.listdir(directory) if f.endswith('.npz') and not f.startswith('.'))
+
+
+def read_results(directory = config.RESULTSDIR, env_name = None):
+    """
+    All the shards in directory concatenated into one array per column, optionally only the games of env_name.
+    """
+    parts = {column: [] for column in COLUMNS}
+    for name in shard_names(directory):
+        with np.load(os.path.join(directory, name)) as shard:
+            for column in COLUMNS:
+                parts[column].append(shard[column])
+
+    if len(parts['env']) == 0:
+        return {column: np.array([]) for column in COLUMNS}
+
+    columns = {column: np.concatenate(values) for column, values in parts.items()}
+    if env_name is not None:
+        keep = columns['env'] == env_name
+        columns = {column: values[keep] for column, values in columns.items()}
+    return columns
+
+
+def merge_shards(directory = config.RESULTSDIR):
+    """
+    Compacts every shard in directory into one. Shards written while the merge runs are left for the next one.
+    """
+    names = shard_names(directory)
+    if len(names) < 2:
+        return len(names)
+    parts = {column: [] for column in COLUMNS}
+    for name in names:
+        with np.load(os.path.join(directory, name)) as shard:
+            for column in COLUMNS:
+                parts[column].append(shard[column])
+    write_shard(os.path.join(directory, f'merged_{int(time.time() * 1000)}_{os.getpid()}.npz'), {column: np.concatenate(values) for column, values in parts.items()})
+    for name in names:
+        os.remove(os.path.join(directory, name))
+    return len(names)
+
+
+def aggregate(columns):
+    """
+    Totals for each (p1, p2) pairing, in the same form as the results of utils.matches.play_games.
+    """
+    pairs, index = np.unique(np.stack([columns['p1'], columns['p2']], axis = 1), axis = 0, return_inverse = True)
+    index = index.reshape(-1)
+    n = len(pairs)
+    result = columns['p1_result']
+    totals = {
+        'games': np.bincount(index, minlength = n),
+        'p1_points': np.bincount(index, weights = columns['p1_points'], minlength = n),
+        'p2_points': np.bincount(index, weights = columns['p2_points'], minlength = n),
+        'p1_wins': np.bincount(index[result == 1], minlength = n),
+        'p2_wins': np.bincount(index[result == -1], minlength = n),
+        'draws': np.bincount(index[result == 0], minlength = n),
+        'episode_length': np.bincount(index, weights = columns['episode_length'], minlength = n),
+    }
+
+    results = {}
+    for i, (p1, p2) in enumerate(pairs):
+        results[(str(p1), str(p2))] = dict({'p1': str(p1), 'p2': str(p2)}, **{key: values[i].item() for key, values in totals.items()})
+    return results
+
+
+def write_csv(filename, rows, fieldnames):
+    with open(filename, 'w', newline = '') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames = fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def write_matrix(filename, names, results, value):
+    # one row per p1, one column per p2
+    rows = []
+    for p1 in names:
+        row = {'p1': p1}
+        for p2 in names:
+            if (p1, p2) in results:
+                row[p2] = round(value(results[(p1, p2)]), 3)
+        rows.append(row)
+    write_csv(filename, rows, ['p1'] + names)
@@ -0,0 +1,150 @@
+import numpy as np
+from collections import OrderedDict
+
+from utils.workers import SelfPlayGames
+from utils.timing import timers
+
+
+class Trajectories():
+    """
+    Transitions collected for PPO, kept as one stream per learner seat.
+    A transition is opened when a seat makes a decision and stays open, collecting the rewards paid to that seat,
+    until the seat's next decision or the end of the game. Only closed transitions are passed to PPO.
+
+    The streams are concatenated into a single flat segment for stable_baselines' add_vtarg_and_adv.
+    Where a stream is cut before the end of its game, the discounted value of its open transition
+    is folded into the reward of the last closed one and the next sample is marked as an episode start,
+    so GAE bootstraps each stream from its own next state rather than running into the following stream.
+    """
+    def __init__(self, gamma):
+        self.gamma = gamma
+        self.pending = OrderedDict()
+        self.returns = {}
+        self.lengths = {}
+        self.clear()
+
+    def clear(self):
+        self.streams = OrderedDict()
+        self.n_closed = 0
+        self.ep_rets = []
+        self.ep_lens = []
+
+    def __len__(self):
+        return self.n_closed
+
+    def act(self, key, observation, action, vpred):
+        if key in self.pending:
+            self.close(key, done = False)
+        # observation may be a view onto a shared buffer that the next step overwrites
+        self.pending[key] = {'observation': np.array(observation), 'action': action, 'vpred': vpred, 'reward': 0.0}
+        self.returns.setdefault(key, 0.0)
+        self.lengths[key] = self.lengths.get(key, 0) + 1
+
+    def reward(self, rewards, keys):
+        # rewards is the vector over seats, keys maps each seat to its stream
+        for seat, key in enumerate(keys):
+            if key in self.pending:
+                self.pending[key]['reward'] += rewards[seat]
+            if key in self.returns:
+                self.returns[key] += rewards[seat]
+
+    def close(self, key, done):
+        transition = self.pending.pop(key)
+        transition['done'] = done
+        self.streams.setdefault(key, []).append(transition)
+        self.n_closed += 1
+
+    def end_episode(self, keys):
+        for key in keys:
+            if key in self.pending:
+                self.close(key, done = True)
+            if key in self.returns:
+                self.ep_rets.append(self.returns.pop(key))
+                self.ep_lens.append(self.lengths.pop(key))
+
+    def segment(self, continue_training = True):
+        transitions = []
+        rewards = []
+        cuts = []
+        for key, stream in self.streams.items():
+            for i, t in enumerate(stream):
+                reward = t['reward']
+                last = i == len(stream) - 1
+                if last and not t['done']:
+                    reward += self.gamma * self.pending[key]['vpred']
+                transitions.append(t)
+                rewards.append(reward)
+                cuts.append(t['done'] or last)
+
+        episode_starts = np.zeros(len(transitions), 'bool')
+        if len(transitions) > 0:
+            episode_starts[0] = True
+            episode_starts[1:] = cuts[:-1]
+
+        seg = {
+            "observations": np.array([t['observation'] for t in transitions]),
+            "rewards": np.array(rewards, 'float32'),
+            "dones": np.array([t['done'] for t in transitions], 'bool'),
+            "episode_starts": episode_starts,
+            "true_rewards": np.array([t['reward'] for t in transitions], 'float32'),
+            "vpred": np.array([t['vpred'] for t in transitions], 'float32'),
+            "actions": np.array([t['action'] for t in transitions]),
+            "nextvpred": 0, # every stream is already bootstrapped or terminal
+            "ep_rets": self.ep_rets,
+            "ep_lens": self.ep_lens,
+            "ep_true_rets": self.ep_rets,
+            "total_timestep": len(transitions),
+            'continue_training': continue_training
+        }
+        self.clear()
+        return seg
+
+
+def selfplay_segment_generator(model, env, horizon, callback, games = None):
+    """
+    Drop-in replacement for stable_baselines' traj_segment_generator that plays whole SelfPlayEnv games,
+    recording a trajectory for every seat moved by the current policy (env.learner_seats)
+    with the rewards each seat receives until its next turn.
+    Opponent seats are played by their agents as usual.
+    With games (e.g. SelfPlayWorkers), the decisions of all the games are batched through the policy at each step.
+    Yields a segment once at least `horizon` transitions have closed.
+    """
+    if games is None:
+        games = SelfPlayGames([env])
+
+    policy = model.policy_pi
+    trajectories = Trajectories(model.gamma)
+    seats = range(games.n_players)
+
+    if games.live:
+        games.set_live(model.get_parameters())
+    observations, players = games.reset()
+    callback.on_rollout_start()
+
+    while True:
+        with timers.time('policy_inference'):
+            actions, vpreds, _, _ = policy.step(observations)
+            # a second forward pass, only for games that record the policy output behind each move
+            policy_outputs = policy.proba_step(observations) if games.record_policy else None
+        for i, (observation, player, action, vpred) in enumerate(zip(observations, players, actions, vpreds)):
+            trajectories.act((i, player), observation, action, vpred)
+
+        observations, players, rewards, dones = games.step(actions, policy_outputs)
+
+        for i in range(games.num_envs):
+            keys = [(i, seat) for seat in seats]
+            trajectories.reward(rewards[i], keys)
+            if dones[i]:
+                trajectories.end_episode(keys)
+
+        callback.update_locals(locals())
+        if callback.on_step() is False:
+            yield trajectories.segment(continue_training = False)
+            return
+
+        if len(trajectories) >= horizon:
+            callback.on_rollout_end()
+            yield trajectories.segment()
+            if games.live:
+                games.set_live(model.get_parameters())
+            callback.on_rollout_start()
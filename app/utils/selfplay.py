@@ -2,8 +2,13 @@ import os
 import numpy as np
 import random
 
-from utils.files import load_model, load_all_models, get_best_model_name
+from utils.files import get_model_names, get_best_model_name
+from utils.registry import registry, LIVE_MODEL
 from utils.agents import Agent
+from utils.numpy_policy import NumpyModel
+from utils.pfsp import PFSP
+from utils.replays import GameRecorder
+from utils.timing import timers
 
 import config
 
@@ -12,103 +17,194 @@ from stable_baselines import logger
 def selfplay_wrapper(env):
     class SelfPlayEnv(env):
         # wrapper over the normal single player env, but loads the best self play model
-        def __init__(self, opponent_type, verbose):
+        def __init__(self, opponent_type, verbose, numpy_opponents = False, pfsp_weighting = 'hard', pfsp_exponent = 2.0, all_seats = False, record_rate = 0, record_policy = False):
             super(SelfPlayEnv, self).__init__(verbose)
             self.opponent_type = opponent_type
-            self.opponent_models = load_all_models(self)
+            self.numpy_opponents = numpy_opponents
+            self.all_seats = all_seats
+            self.opponent_name = None
+            self.recorder = None
+            self.game_random = None
+            if record_rate > 0:
+                self.recorder = GameRecorder(self.name, self.n_players, self.action_space.n, sample_rate = record_rate, policy_outputs = record_policy)
+            if self.opponent_type == 'pfsp':
+                self.pfsp = PFSP(pfsp_weighting, pfsp_exponent)
+            registry.attach(self)
+            self.opponent_model('base.zip') # makes sure base.zip exists before training starts
+            self.opponent_names = ['base.zip'] + get_model_names(self.name)
             self.best_model_name = get_best_model_name(self.name)
 
+        def opponent_model(self, name):
+            # generations are only loaded when sampled, and are shared by all envs in the process
+            return registry.get(self, name, numpy_model = self.numpy_opponents)
+
+        def set_live_parameters(self, params):
+            # used by subprocess workers, which can't share the learner's graph
+            registry.set_live(self.name, self.numpy_opponents, NumpyModel(self.name, self.observation_space, params))
+
+        def set_opponent(self, name, agent_name = 'ppo_opponent'):
+            self.opponent_name = name
+            self.opponent_agent = Agent(agent_name, self.opponent_model(name))
+
         def setup_opponents(self):
             if self.opponent_type == 'rules':
                 self.opponent_agent = Agent('rules')
             else:
-                # incremental load of new model
+                # incremental update of the available generations - when prefetching, only once the new model is loaded
                 best_model_name = get_best_model_name(self.name)
-                if self.best_model_name != best_model_name:
-                    self.opponent_models.append(load_model(self, best_model_name ))
+                if self.best_model_name != best_model_name and registry.ready(self.name, best_model_name, self.numpy_opponents):
+                    self.opponent_names.append(best_model_name)
                     self.best_model_name = best_model_name
 
                 if self.opponent_type == 'random':
                     start = 0
-                    end = len(self.opponent_models) - 1
+                    end = len(self.opponent_names) - 1
                     i = random.randint(start, end)
-                    self.opponent_agent = Agent('ppo_opponent', self.opponent_models[i]) 
+                    self.set_opponent(self.opponent_names[i]) 
 
                 elif self.opponent_type == 'best':
-                    self.opponent_agent = Agent('ppo_opponent', self.opponent_models[-1])  
+                    self.set_opponent(self.opponent_names[-1])  
 
                 elif self.opponent_type == 'mostly_best':
                     j = random.uniform(0,1)
                     if j < 0.8:
-                        self.opponent_agent = Agent('ppo_opponent', self.opponent_models[-1])  
+                        self.set_opponent(self.opponent_names[-1])  
                     else:
                         start = 0
-                        end = len(self.opponent_models) - 1
+                        end = len(self.opponent_names) - 1
                         i = random.randint(start, end)
-                        self.opponent_agent = Agent('ppo_opponent', self.opponent_models[i])  
+                        self.set_opponent(self.opponent_names[i])  
 
                 elif self.opponent_type == 'base':
-                    self.opponent_agent = Agent('base', self.opponent_models[0])  
+                    self.set_opponent(self.opponent_names[0], 'base')  
+
+                elif self.opponent_type == 'pfsp':
+                    self.set_opponent(self.pfsp.sample(self.opponent_names))
+
+                elif self.opponent_type == 'self':
+                    self.set_opponent(LIVE_MODEL)
 
             self.agent_player_num = np.random.choice(self.n_players)
             self.agents = [self.opponent_agent] * self.n_players
             self.agents[self.agent_player_num] = None
-            try:
-                #if self.players is defined on the base environment
-                logger.debug(f'Agent plays as Player {self.players[self.agent_player_num].id}')
-            except:
-                pass
+            if logger.get_level() <= config.DEBUG:
+                try:
+                    #if self.players is defined on the base environment
+                    logger.debug(f'Agent plays as Player {self.players[self.agent_player_num].id}')
+                except:
+                    pass
 
 
         def reset(self):
-            super(SelfPlayEnv, self).reset()
-            self.setup_opponents()
+            self.start_game()
 
-            if self.current_player_num != self.agent_player_num:   
+            if self.opponent_to_move:   
                 self.continue_game()
 
             return self.observation
 
+        def start_game(self):
+            # resets the base game and draws new opponents, without playing any opponent moves
+            if self.recorder is not None:
+                self.game_random = self.recorder.start()
+            with timers.time('env_step'):
+                if self.game_random is None:
+                    super(SelfPlayEnv, self).reset()
+                else:
+                    with self.game_random.active():
+                        super(SelfPlayEnv, self).reset()
+            self.setup_opponents()
+
+        def play_move(self, action, policy_output = None):
+            # a step of the base game - in a recorded game, with the game's own random state
+            if self.game_random is None:
+                with timers.time('env_step'):
+                    return super(SelfPlayEnv, self).step(action)
+
+            with timers.time('env_step'), self.game_random.active():
+                observation, reward, done, info = super(SelfPlayEnv, self).step(action)
+            self.recorder.record(action, reward, policy_output)
+            if done:
+                self.recorder.finish(['learner' if i in self.learner_seats else str(self.opponent_name or 'rules') for i in range(self.n_players)])
+                self.game_random = None
+            return observation, reward, done, info
+
+        @property
+        def record_policy(self):
+            # whether recorded games keep the policy output behind each move, the learner's included
+            return self.recorder is not None and self.recorder.policy_outputs
+
         @property
         def current_agent(self):
             return self.agents[self.current_player_num]
 
+        @property
+        def learner_seats(self):
+            # seats whose moves come from the policy being trained - with all_seats, every seat when playing the live policy
+            if self.all_seats and self.opponent_name == LIVE_MODEL:
+                return range(self.n_players)
+            return [self.agent_player_num]
+
+        @property
+        def opponent_to_move(self):
+            return not self.done and self.current_player_num not in self.learner_seats
+
         def continue_game(self):
             observation = None
             reward = None
             done = None
 
-            while self.current_player_num != self.agent_player_num:
+            while self.opponent_to_move:
                 self.render()
-                action = self.current_agent.choose_action(self, choose_best_action = False, mask_invalid_actions = False)
-                observation, reward, done, _ = super(SelfPlayEnv, self).step(action)
+                agent = self.current_agent
+                with timers.time('opponent_inference'):
+                    action = agent.choose_action(self, choose_best_action = False, mask_invalid_actions = False)
+                observation, reward, done, _ = self.play_opponent_move(action, agent.action_probs)
+
+            return observation, reward, done, None
+
+        def play_opponent_move(self, action, policy_output = None):
+            observation, reward, done, _ = self.play_move(action, policy_output)
+            if logger.get_level() <= config.DEBUG:
                 logger.debug(f'Rewards: {reward}')
                 logger.debug(f'Done: {done}')
-                if done:
-                    break
+            return observation, reward, done, None
 
+        def play_agent_move(self, action, policy_output = None):
+            self.render()
+            observation, reward, done, _ = self.play_move(action, policy_output)
+            if logger.get_level() <= config.DEBUG:
+                logger.debug(f'Action played by agent: {action}')
+                logger.debug(f'Rewards: {reward}')
+                logger.debug(f'Done: {done}')
             return observation, reward, done, None
 
+        def finish_step(self, observation, reward, done):
+            agent_reward = reward[self.agent_player_num]
+            if logger.get_level() <= config.DEBUG:
+                logger.debug(f'\nReward To Agent: {agent_reward}')
 
-        def step(self, action):
-            self.render()
-            observation, reward, done, _ = super(SelfPlayEnv, self).step(action)
-            logger.debug(f'Action played by agent: {action}')
-            logger.debug(f'Rewards: {reward}')
-            logger.debug(f'Done: {done}')
+            if done:
+                self.render()
+                if self.opponent_type == 'pfsp':
+                    self.pfsp.update(self.opponent_name, agent_reward)
+
+            return observation, agent_reward, done, {} 
+
+        def step(self, action, policy_output = None):
+            observation, reward, done, _ = self.play_agent_move(action, policy_output)
 
             if not done:
                 package = self.continue_game()
                 if package[0] is not None:
                     observation, reward, done, _ = package
 
+            return self.finish_step(observation, reward, done)
 
-            agent_reward = reward[self.agent_player_num]
-            logger.debug(f'\nReward To Agent: {agent_reward}')
+        def close(self):
+            if self.recorder is not None:
+                self.recorder.close()
+            super(SelfPlayEnv, self).close()
 
-            if done:
-                self.render()
-
-            return observation, agent_reward, done, {} 
+    return SelfPlayEnv
 
-    return SelfPlayEnv
\ No newline at end of file
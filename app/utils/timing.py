@@ -0,0 +1,118 @@
+import time
+from collections import defaultdict
+
+import tensorflow as tf
+from mpi4py import MPI
+
+from stable_baselines import logger
+
+
+class Timer():
+    # times a block into one phase - one instance per phase, so blocks of the same phase mustn't nest
+    def __init__(self, timers, name):
+        self.timers = timers
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.timers.add(self.name, time.perf_counter() - self.start)
+
+
+class NullTimer():
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+class PhaseTimers():
+    """
+    Process-wide wall-clock totals for the phases of self-play training, reset every PPO iteration.
+    Phases nest: env_step, opponent_inference, policy_inference, model_load, evaluation and mpi
+    all happen inside rollout, while ppo_update is PPO1's optimisation step, including its own MPI reductions.
+    When disabled, time() hands back a shared no-op context manager.
+    Worker and actor processes send their own totals back to be merged in, so with several of them
+    a phase's total is summed over the processes that ran it.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.totals = defaultdict(float)
+        self.dumped = defaultdict(float)
+        self.writer = None # PPO1's tensorboard writer, while learn() is running
+        self.timers = {}
+
+    def enable(self, enabled = True):
+        self.enabled = enabled
+
+    def time(self, name):
+        if not self.enabled:
+            return NULL_TIMER
+        timer = self.timers.get(name)
+        if timer is None:
+            timer = self.timers[name] = Timer(self, name)
+        return timer
+
+    def add(self, name, seconds):
+        if self.enabled:
+            self.totals[name] += seconds
+
+    def collect(self):
+        # this process's totals since the last collect, for a subprocess to send back to the learner
+        totals = dict(self.totals)
+        self.totals.clear()
+        return totals
+
+    def merge(self, totals):
+        for name, seconds in totals.items():
+            self.add(name, seconds)
+
+    def dump(self, step = None):
+        """
+        Records the mean and max over ranks of each phase's total since the last dump through logger.record_tabular,
+        so they are written with PPO1's own stats for the iteration, and to tensorboard at step while learn() is running.
+        A collective, so every rank must call it.
+        """
+        gathered = MPI.COMM_WORLD.allgather(dict(self.totals))
+        names = sorted(set(name for totals in gathered for name in totals))
+        values = []
+        for name in names:
+            seconds = [totals.get(name, 0.0) for totals in gathered]
+            for tag, value in [(f'time/{name}', sum(seconds) / len(seconds)), (f'time/{name}_max', max(seconds))]:
+                logger.record_tabular(tag, value)
+                values.append(tf.Summary.Value(tag = tag, simple_value = value))
+        if self.writer is not None and step is not None and MPI.COMM_WORLD.Get_rank() == 0:
+            self.writer.add_summary(tf.Summary(value = values), step)
+        for name, seconds in self.totals.items():
+            self.dumped[name] += seconds
+        self.totals.clear()
+
+    def elapsed(self, name):
+        # this rank's total for a phase over the whole run
+        return self.dumped[name] + self.totals[name]
+
+
+timers = PhaseTimers()
+
+
+def timed_segments(segments, timers, model):
+    """
+    Wraps a segment generator, timing the collection of each segment as rollout and the time until
+    the next one is asked for as ppo_update. The update is recorded after its own iteration's stats
+    are written, so it shows up one iteration late.
+    """
+    start = time.perf_counter()
+    for segment in segments:
+        timers.add('rollout', time.perf_counter() - start)
+        timers.dump(model.num_timesteps)
+        yielded = time.perf_counter()
+        yield segment
+        start = time.perf_counter()
+        timers.add('ppo_update', start - yielded)
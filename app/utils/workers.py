@@ -0,0 +1,207 @@
+import random
+import multiprocessing
+import numpy as np
+
+from utils.timing import timers
+
+
+class SelfPlayGames():
+    """
+    A batch of SelfPlayEnv games driven from the learner's point of view.
+    Each game is advanced to its next learner decision, so every step takes one action per game,
+    and returns the observation and seat to move next, the rewards paid to every seat since the last step,
+    and whether the game finished. Finished games are restarted automatically.
+    Opponent moves are played in rounds across the games: the games waiting on the same opponent model
+    are decided by one batched forward pass, so the cost of a round doesn't grow with the number of games.
+    """
+    live = False # in-process games see the learner through the registry, via LiveWeightsCallback
+
+    def __init__(self, envs):
+        self.envs = envs
+        self.num_envs = len(envs)
+        self.n_players = envs[0].n_players
+        self.record_policy = any(env.record_policy for env in envs)
+
+    def observe(self):
+        observations = np.stack([env.observation for env in self.envs])
+        seats = np.array([env.current_player_num for env in self.envs])
+        return observations, seats
+
+    def reset(self):
+        self.restart(range(self.num_envs))
+        return self.observe()
+
+    def restart(self, indices):
+        for i in indices:
+            self.envs[i].start_game()
+        self.play_opponents(indices)
+
+    def step(self, actions, policy_outputs = None):
+        # policy_outputs, the learner's action probabilities behind actions, are only needed when record_policy is set
+        rewards = np.zeros((self.num_envs, self.n_players))
+        dones = np.zeros(self.num_envs, 'bool')
+
+        for i, (env, action) in enumerate(zip(self.envs, actions)):
+            _, rewards[i], _, _ = env.play_agent_move(action, None if policy_outputs is None else policy_outputs[i])
+
+        rewards += self.play_opponents(range(self.num_envs))
+
+        for i, env in enumerate(self.envs):
+            if env.done:
+                env.finish_step(None, rewards[i], True)
+                dones[i] = True
+
+        self.restart(np.flatnonzero(dones))
+        observations, seats = self.observe()
+        return observations, seats, rewards, dones
+
+    def play_opponents(self, indices):
+        """
+        Plays opponent moves in the given games up to their next learner decision, returning the rewards paid
+        to every seat of every game on the way. Each round groups the games by the opponent model to move,
+        so that each model makes a single batched forward pass.
+        """
+        rewards = np.zeros((self.num_envs, self.n_players))
+        pending = [i for i in indices if self.envs[i].opponent_to_move]
+
+        while len(pending) > 0:
+            groups = {}
+            for i in pending:
+                agent = self.envs[i].current_agent
+                key = id(agent) if agent.model is None else id(agent.model)
+                groups.setdefault(key, (agent, []))[1].append(i)
+
+            for agent, group in groups.values():
+                envs = [self.envs[i] for i in group]
+                for env in envs:
+                    env.render()
+                with timers.time('opponent_inference'):
+                    actions = agent.choose_actions(envs, choose_best_action = False, mask_invalid_actions = False)
+                for i, env, action, policy_output in zip(group, envs, actions, agent.batch_action_probs):
+                    _, reward, _, _ = env.play_opponent_move(action, policy_output)
+                    rewards[i] += reward
+
+            pending = [i for i in pending if self.envs[i].opponent_to_move]
+
+        return rewards
+
+    def set_live(self, params):
+        pass
+
+    def close(self):
+        for env in self.envs:
+            env.close()
+
+
+class SharedBuffers():
+    """
+    Per-game result slots in shared memory, viewed as numpy arrays.
+    Allocated before the workers are forked, so each worker writes the rows of its games in place
+    and the learner reads the whole batch with no pickling and no copy.
+    """
+    def __init__(self, ctx, num_envs, observation_space, n_players):
+        self.observations = self.allocate(ctx, (num_envs,) + observation_space.shape, np.float32)
+        self.seats = self.allocate(ctx, (num_envs,), np.int64)
+        self.rewards = self.allocate(ctx, (num_envs, n_players), np.float64)
+        self.dones = self.allocate(ctx, (num_envs,), np.bool_)
+
+    def allocate(self, ctx, shape, dtype):
+        raw = ctx.RawArray(np.ctypeslib.as_ctypes_type(dtype), int(np.prod(shape)))
+        return np.frombuffer(raw, dtype = dtype).reshape(shape)
+
+    def write(self, start, observations, seats, rewards = None, dones = None):
+        end = start + len(seats)
+        self.observations[start:end] = observations
+        self.seats[start:end] = seats
+        if rewards is not None:
+            self.rewards[start:end] = rewards
+            self.dones[start:end] = dones
+
+    def read(self, with_rewards = True):
+        if with_rewards:
+            return self.observations, self.seats, self.rewards, self.dones
+        return self.observations, self.seats
+
+
+def worker(remote, parent_remote, env_fns, seed, buffers, start):
+    parent_remote.close()
+    random.seed(seed)
+    np.random.seed(seed)
+    games = SelfPlayGames([env_fn() for env_fn in env_fns])
+
+    while True:
+        cmd, data = remote.recv()
+        if cmd == 'step':
+            buffers.write(start, *games.step(*data))
+            remote.send(timers.collect())
+        elif cmd == 'reset':
+            buffers.write(start, *games.reset())
+            remote.send(timers.collect())
+        elif cmd == 'set_live':
+            games.envs[0].set_live_parameters(data)
+        elif cmd == 'close':
+            games.close()
+            remote.close()
+            break
+        else:
+            raise NotImplementedError(f'Unknown worker command {cmd}')
+
+
+class SelfPlayWorkers():
+    """
+    SelfPlayGames split over subprocesses, games_per_worker to a process, so one learner per rank can batch
+    the decisions of many games, and each worker batches the opponent moves of its own games.
+    Workers are forked, so env_fn doesn't need to be picklable,
+    and should use NumPy opponents so that no worker builds a TF graph.
+    Results come back through SharedBuffers - the pipes only carry actions and acknowledgements with the workers' phase times.
+    The returned arrays are views that the next step overwrites.
+    With live set, the learner's current parameters are sent to the workers for the 'self' opponent.
+    record_policy says whether the workers' games record policy outputs, so the learner's have to be sent with its actions.
+    """
+    def __init__(self, env_fns, observation_space, n_players, seed = 0, live = False, games_per_worker = 1, record_policy = False):
+        self.num_envs = len(env_fns)
+        self.n_players = n_players
+        self.live = live
+        self.record_policy = record_policy
+        self.starts = list(range(0, self.num_envs, games_per_worker))
+        self.ends = self.starts[1:] + [self.num_envs]
+        ctx = multiprocessing.get_context('fork')
+        self.buffers = SharedBuffers(ctx, self.num_envs, observation_space, n_players)
+        self.remotes, work_remotes = zip(*[ctx.Pipe() for _ in self.starts])
+        self.processes = []
+        for i, (work_remote, remote, start, end) in enumerate(zip(work_remotes, self.remotes, self.starts, self.ends)):
+            process = ctx.Process(target = worker, args = (work_remote, remote, env_fns[start:end], seed + i, self.buffers, start), daemon = True)
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+        self.closed = False
+
+    def wait(self):
+        # each worker acknowledges with its phase times since the last step
+        for remote in self.remotes:
+            timers.merge(remote.recv())
+
+    def reset(self):
+        for remote in self.remotes:
+            remote.send(('reset', None))
+        self.wait()
+        return self.buffers.read(with_rewards = False)
+
+    def step(self, actions, policy_outputs = None):
+        for remote, start, end in zip(self.remotes, self.starts, self.ends):
+            remote.send(('step', (actions[start:end], None if policy_outputs is None else policy_outputs[start:end])))
+        self.wait()
+        return self.buffers.read()
+
+    def set_live(self, params):
+        for remote in self.remotes:
+            remote.send(('set_live', params))
+
+    def close(self):
+        if self.closed:
+            return
+        for remote in self.remotes:
+            remote.send(('close', None))
+        for process in self.processes:
+            process.join()
+        self.closed = True
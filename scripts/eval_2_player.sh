@@ -7,7 +7,8 @@ else
 BEST=''
 fi
 
-rm ./app/viz/results.csv
+# test.py -w writes result shards to viz/results, merged into viz/results_<env>.csv by aggregate.py at the end
+rm -f ./app/viz/results/*.npz
 declare -a FILES=("./app/zoo/$6/best_model.zip")
 
 
@@ -72,3 +73,5 @@ then
 
 fi
 
+echo "Aggregating results..."
+docker exec -it selfplay python3 aggregate.py -e $6
@@ -7,7 +7,8 @@ else
 BEST=''
 fi
 
-rm ./app/viz/results.csv
+# test.py -w writes result shards to viz/results, merged into viz/results_<env>.csv by aggregate.py at the end
+rm -f ./app/viz/results/*.npz
 declare -a FILES=("./app/zoo/$6/best_model.zip")
 
 
@@ -45,3 +46,5 @@ do
     let "counter1+=1" 
 done
 
+echo "Aggregating results..."
+docker exec -it selfplay python3 aggregate.py -e $6